@@ -28,11 +28,13 @@ logging.basicConfig(
     datefmt="%H:%M:%S",
 )
 from src.familylog.processor.assembler import assemble_sessions
-from src.familylog.processor.obsidian_writer import process_assembled_sessions
+from src.familylog.processor.obsidian_writer import process_assembled_sessions, close_client
 from src.familylog.storage.database import init_db, AsyncSessionLocal
 from src.familylog.processor.stt import process_voice_messages
 from src.familylog.processor.vision import process_photo_messages
 from src.familylog.processor.documents import process_document_messages
+from src.familylog.storage.telegram_files import close_client as close_telegram_client
+from src.familylog.LLMs_calls.client import close_async_client
 from src.config import settings
 
 
@@ -74,6 +76,9 @@ async def phase1(session):
     # ── 3b. Документы ───────────────────────────────────────────────
     doc_count = await process_document_messages(session)
     print(f"{'*' * 50}\nОбработано документов: {doc_count}")
+    # Все медиа обработаны — соединения с Telegram и асинхронный клиент vision больше не нужны
+    await close_telegram_client()
+    await close_async_client()
 
     # ── 4. Выгружаем vision модель ──────────────────────────────────
     if settings.CONNECTION_TYPE == "offline":
@@ -102,6 +107,7 @@ async def phase2(session):
 
     # ── 7. Запись в Obsidian ────────────────────────────────────────
     obsidian_count = await process_assembled_sessions(session)
+    await close_client()
     print(f"{'*' * 50}\nЗаписано в Obsidian: {obsidian_count}")
 
     return obsidian_count
@@ -110,33 +116,39 @@ async def phase2(session):
 async def main():
     await init_db()
 
-    async with AsyncSessionLocal() as session:
-
-        # ── ФАЗА 1: Сбор данных ────────────────────────────────────
-        assembled = await phase1(session)
-
-        if assembled == 0:
-            print("\nНет сессий для обработки. Завершаем.")
-            return
-
-        # ── ПАУЗА: Ожидание загрузки модели ────────────────────────
-        print("\n" + "=" * 60)
-        print(f"  Собрано {assembled} сессий для обработки.")
-        print(f"  Текущая LLM модель: {settings.llm_model}")
-        print()
-        print("  Сейчас:")
-        print("  1. Загрузите нужную модель в LM Studio")
-        print("  2. Убедитесь что модель указана в config:")
-        print(f"     LLM_MODEL_OFFLINE = {settings.LLM_MODEL_OFFLINE}")
-        print("  3. Нажмите Enter для продолжения")
-        print("=" * 60)
-
-        input("\n>>> Нажмите Enter когда модель загружена... ")
-
-        # ── ФАЗА 2: LLM обработка ──────────────────────────────────
-        obsidian_count = await phase2(session)
-
-        print(f"\n{'*' * 50}\nГотово! Записано {obsidian_count} заметок.")
+    try:
+        async with AsyncSessionLocal() as session:
+
+            # ── ФАЗА 1: Сбор данных ────────────────────────────────────
+            assembled = await phase1(session)
+
+            if assembled == 0:
+                print("\nНет сессий для обработки. Завершаем.")
+                return
+
+            # ── ПАУЗА: Ожидание загрузки модели ────────────────────────
+            print("\n" + "=" * 60)
+            print(f"  Собрано {assembled} сессий для обработки.")
+            print(f"  Текущая LLM модель: {settings.llm_model}")
+            print()
+            print("  Сейчас:")
+            print("  1. Загрузите нужную модель в LM Studio")
+            print("  2. Убедитесь что модель указана в config:")
+            print(f"     LLM_MODEL_OFFLINE = {settings.LLM_MODEL_OFFLINE}")
+            print("  3. Нажмите Enter для продолжения")
+            print("=" * 60)
+
+            input("\n>>> Нажмите Enter когда модель загружена... ")
+
+            # ── ФАЗА 2: LLM обработка ──────────────────────────────────
+            obsidian_count = await phase2(session)
+
+            print(f"\n{'*' * 50}\nГотово! Записано {obsidian_count} заметок.")
+    finally:
+        # Пулы соединений закрываем и при ошибке пайплайна (повторный close безопасен)
+        await close_telegram_client()
+        await close_async_client()
+        await close_client()
 
 
 if __name__ == "__main__":
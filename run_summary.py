@@ -22,6 +22,7 @@ from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
 from src.config import settings
 from src.familylog.processor.summary import run_summary
+from src.familylog.processor.obsidian_writer import close_client
 
 logging.basicConfig(
     level=logging.INFO,
@@ -53,7 +54,10 @@ async def main():
     logger.info("FamilyLog Summary")
     logger.info("=" * 60)
 
-    result = await run_summary()
+    try:
+        result = await run_summary()
+    finally:
+        await close_client()
 
     summary_text = result["summary_text"]
     logger.info("--- Summary ---\n%s\n--- end ---", summary_text)
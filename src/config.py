@@ -8,8 +8,16 @@ class Settings(BaseSettings):
     # Инфраструктура
     BOT_TOKEN: str
     DATABASE_URL: str = "sqlite+aiosqlite:///familylog.db"
+    # Режим разработки: ленивые загрузки связей в запросах пайплайна бросают ошибку (raiseload)
+    DEBUG: bool = False
     CONTEXT_MEMORY_DAYS: int = 90
     SESSION_TIMEOUT_MINUTES: int = 30
+    # Сколько сессий одновременно пишется в Obsidian (LLM + vault I/O)
+    MAX_CONCURRENT_SESSIONS: int = 4
+    # Сколько голосовых/фото одновременно скачивается и обрабатывается (сеть, vision LLM)
+    MAX_CONCURRENT_MEDIA: int = 8
+    # Через сколько обработанных голосовых/фото фиксировать статусы в БД (остаток — в конце)
+    MEDIA_COMMIT_BATCH: int = 16
 
     # Telegram — chat_id всех членов семьи
     FAMILY_CHAT_IDS: list[int] = [987692540, 6293359903]
@@ -28,12 +36,21 @@ class Settings(BaseSettings):
     # Доступные offline модели:
     #   "gigaam-v3-e2e-rnnt"  — лучшее качество RU, пунктуация из коробки (~892MB)
     #   "gigaam-v3-e2e-ctc"   — чуть хуже, но быстрее и легче (~225MB, int8)
-    #   "nemo-conformer-tdt"  — Parakeet, мультиязычный (нужен quantization="int8")
+    #   "nemo-conformer-tdt"  — Parakeet, мультиязычный (нужен STT_QUANT="int8")
     #
     # STT_MODEL_PATH — папка куда скачивается модель (uv run download_models.py)
     # Должна совпадать с именем модели для наглядности.
     STT_MODEL_OFFLINE: str = "gigaam-v3-e2e-rnnt"
     STT_MODEL_PATH: str = f"{BASE_DIR}/stt_models/gigaam-v3-e2e-rnnt/"
+    # Потоки ONNX Runtime внутри одного оператора; 0 — половина ядер
+    STT_INTRA_THREADS: int = 0
+    # Квантование STT модели:
+    #   ""         — FP32 (по умолчанию; динамический int8 на CPU часто медленнее)
+    #   "int8"     — готовые *.int8.onnx из репозитория модели
+    #   "int8-qop" — int8 только для MatMul, файлы создаются локально при первой загрузке
+    STT_QUANT: str = ""
+    # Сколько готовых голосовых распознаётся одним прогоном модели (батч onnx_asr)
+    STT_BATCH_SIZE: int = 8
 
     # Онлайн STT — мультимодальный LLM через OpenRouter
     # Используется когда CONNECTION_TYPE="online"
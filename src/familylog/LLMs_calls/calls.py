@@ -1,17 +1,17 @@
 from typing import Optional
 
 from src.config import settings
-from .client import get_client
+from .client import get_async_client, get_client
 
 
-def llm_process_photo(base64_str: str, caption: Optional[str]) -> str:
-    client = get_client()
+async def llm_process_photo(image_url: str, caption: Optional[str]) -> str:
+    client = get_async_client()
     caption_prompt = ''
     if caption:
         caption_prompt = f"Заголовок фотографии --> '{caption}' - учитывай это при составлении описания"
 
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=settings.vision_model,
             messages=[
                 {
@@ -37,7 +37,7 @@ def llm_process_photo(base64_str: str, caption: Optional[str]) -> str:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_str}"
+                                "url": image_url
                             }
                         }
                     ]
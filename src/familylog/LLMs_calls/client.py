@@ -1,4 +1,5 @@
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI
 from src.config import settings
 
 
@@ -13,3 +14,30 @@ def get_client():
             api_key=settings.llm_api_key,
         )
     return _connection
+
+
+# Асинхронный клиент — для вызовов, которые идут пачкой из event loop (vision):
+# запросы к LM Studio идут по общим keep-alive соединениям, не занимая потоки
+_async_connection = None
+
+
+def get_async_client() -> AsyncOpenAI:
+    global _async_connection
+    if _async_connection is None:
+        _async_connection = AsyncOpenAI(
+            base_url=settings.llm_base_url,
+            api_key=settings.llm_api_key,
+            # Клиент SDK с его таймаутами (600 с на ответ) и редиректами — меняем только пул
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_keepalive_connections=max(1, settings.MAX_CONCURRENT_MEDIA)),
+            ),
+        )
+    return _async_connection
+
+
+async def close_async_client() -> None:
+    """Закрывает асинхронный клиент LLM (вызывать в конце прогона)."""
+    global _async_connection
+    if _async_connection is not None:
+        await _async_connection.close()
+        _async_connection = None
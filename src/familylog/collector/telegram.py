@@ -1,11 +1,12 @@
 import logging
 
-import httpx
 from datetime import datetime, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import insert, select
 
 from src.logger import logger
+from ..storage.database import strict_loading
+from ..storage.telegram_files import get_client
 from ..storage.models import Message, Setting, Session
 from src.config import settings
 
@@ -32,7 +33,7 @@ async def get_setting(session: AsyncSession, key: str) -> str | None:
 
 
 async def save_setting(session: AsyncSession, key: str, value: str) -> None:
-    """Сохраняет значение в таблицу Settings."""
+    """Сохраняет значение в таблицу Settings в текущей транзакции (commit — за вызывающим)."""
     result = await session.execute(
         select(Setting).where(Setting.key == key)
     )
@@ -44,7 +45,6 @@ async def save_setting(session: AsyncSession, key: str, value: str) -> None:
     else:
         session.add(Setting(key=key, value=value))
         logger.info(f'В таблице settings создана новая запись: {key} = {value}')
-    await session.commit()
 
 
 async def get_last_update_id(session: AsyncSession) -> int:
@@ -63,7 +63,7 @@ async def get_open_session(session: AsyncSession, author_id: int) -> Session | N
         select(Session).where(
             Session.author_id == author_id,
             Session.status == "open"
-        )
+        ).options(*strict_loading())
     )
     return result.scalar_one_or_none()
 
@@ -71,7 +71,6 @@ async def get_open_session(session: AsyncSession, author_id: int) -> Session | N
 async def close_session(session: AsyncSession, db_session: Session) -> None:
     db_session.status = "ready"
     db_session.closed_at = datetime.now()
-    await session.commit()
 
 
 async def close_all_open_sessions(session: AsyncSession) -> int:
@@ -82,7 +81,7 @@ async def close_all_open_sessions(session: AsyncSession) -> int:
         select(Session).where(
             Session.status == "open",
             Session.last_message_at < cutoff,
-        )
+        ).options(*strict_loading())
     )
     open_sessions = result.scalars().all()
 
@@ -105,18 +104,28 @@ def parse_intent(text: str) -> str:
 
 
 async def fetch_updates(offset: int) -> list[dict]:
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        response = await client.get(
-            f"{TG_API}/getUpdates",
-            params={"offset": offset + 1, "limit": 200, "timeout": 10},
-        )
-        logger.info(f'Пробуем достать данные из телеграма Параметры offset = {offset} - это значение id последнего сообщения в чате.')
-        data = response.json()
+    # Общий клиент с telegram_files: соединение с api.telegram.org потом
+    # переиспользуется для скачивания голосовых, фото и документов
+    client = get_client()
+    response = await client.get(
+        f"{TG_API}/getUpdates",
+        params={"offset": offset + 1, "limit": 200, "timeout": 10},
+    )
+    logger.info(f'Пробуем достать данные из телеграма Параметры offset = {offset} - это значение id последнего сообщения в чате.')
+    data = response.json()
+
+    if not data["ok"]:
+        raise Exception(f"Telegram API error: {data}")
+    logger.info(f'Данные от телеграма получены = \n {data}')
+    return data["result"]
+
 
-        if not data["ok"]:
-            raise Exception(f"Telegram API error: {data}")
-        logger.info(f'Данные от телеграма получены = \n {data}')
-        return data["result"]
+async def bulk_store_messages(session: AsyncSession, rows: list[dict]) -> None:
+    """Вставляет сообщения одним executemany (insertmanyvalues) в текущей транзакции.
+
+    Для пачки из getUpdates вместо session.add() + commit() на каждое сообщение.
+    """
+    await session.execute(insert(Message), rows)
 
 
 async def open_session(
@@ -193,12 +202,15 @@ async def collect_messages(session: AsyncSession) -> int:
         return 0
 
     saved_count = 0
+    # Вся пачка — одна транзакция: сообщения вставляются разом в конце вместе
+    # с last_update_id, при сбое пачка целиком перечитается из Telegram
+    message_rows: list[dict] = []
 
     for update in updates:
         update_id = update["update_id"]
+        last_update_id = update_id
 
         if "message" not in update:
-            await save_last_update_id(session, update_id)
             continue
 
         msg = update["message"]
@@ -228,9 +240,6 @@ async def collect_messages(session: AsyncSession) -> int:
 
                 # Запоминаем последний intent пользователя
                 await save_setting(session, f"last_intent_{author_id}", intent)
-                await session.commit()
-
-                await save_last_update_id(session, update_id)
                 continue
 
             content_type = "text"
@@ -282,7 +291,6 @@ async def collect_messages(session: AsyncSession) -> int:
                     caption = f"{forward_info}\n{caption}" if caption else forward_info
 
         else:
-            await save_last_update_id(session, update_id)
             continue
 
         # ── Привязываем к сессии ────────────────────────────────────────────
@@ -312,7 +320,7 @@ async def collect_messages(session: AsyncSession) -> int:
             doc_filename = doc_info.get("file_name", "unknown_file")
             doc_mime_type = doc_info.get("mime_type", "application/octet-stream")
 
-        db_message = Message(
+        message_rows.append(dict(
             telegram_message_id=msg["message_id"],
             chat_id=chat_id,
             author_id=author_id,
@@ -333,13 +341,14 @@ async def collect_messages(session: AsyncSession) -> int:
             forward_post_url=forward_data.get("forward_post_url"),
             document_filename=doc_filename,
             document_mime_type=doc_mime_type,
-        )
-        session.add(db_message)
-        await session.commit()
+        ))
 
         saved_count += 1
         logger.debug("Сохранено %s → session_id=%d, intent=%s", content_type, current_session.id, current_session.intent)
 
-        await save_last_update_id(session, update_id)
+    if message_rows:
+        await bulk_store_messages(session, message_rows)
+    await save_last_update_id(session, last_update_id)
+    await session.commit()
 
     return saved_count
\ No newline at end of file
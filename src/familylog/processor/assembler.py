@@ -2,15 +2,20 @@ import logging
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
-from ..storage.models import Session, Message
+from ..storage.database import strict_loading
+from ..storage.models import Session
 
 logger = logging.getLogger(__name__)
 
 
 async def assemble_sessions(session: AsyncSession) -> int:
+    # Сообщения всех сессий — одним IN-запросом (selectin), уже по created_at
     result = await session.execute(
-        select(Session).where(Session.status == "ready")
+        select(Session)
+        .where(Session.status == "ready")
+        .options(selectinload(Session.messages), *strict_loading())
     )
 
     sessions = result.scalars().all()
@@ -18,14 +23,7 @@ async def assemble_sessions(session: AsyncSession) -> int:
 
     processed_count = 0
     for s in sessions:
-
-        messages_result = await session.execute(
-            select(Message)
-            .where(Message.session_id == s.id)
-            .order_by(Message.created_at)
-        )
-
-        messages = messages_result.scalars().all()
+        messages = s.messages
 
         if not messages:
             s.status = "empty"
@@ -5,7 +5,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..storage.models import Message
-from ..storage.telegram_files import download_file
+from ..storage.telegram_files import download_files
 
 logger = logging.getLogger(__name__)
 
@@ -31,33 +31,33 @@ async def process_document_messages(session: AsyncSession) -> int:
 
     processed_count = 0
 
-    for msg in messages:
-        try:
-            original_name = msg.document_filename or "unknown_file"
-            extension = Path(original_name).suffix.lstrip(".") or "bin"
+    # Все документы пачки качаются параллельно (общий лимит — в telegram_files)
+    names = [msg.document_filename or "unknown_file" for msg in messages]
+    file_paths = await download_files([
+        (msg.raw_content, MEDIA_DIR, Path(name).suffix.lstrip(".") or "bin")
+        for msg, name in zip(messages, names)
+    ])
 
-            logger.info("Обрабатываем документ %d: %s...", msg.id, original_name)
+    for msg, original_name, file_path in zip(messages, names, file_paths):
+        logger.info("Обрабатываем документ %d: %s...", msg.id, original_name)
 
-            # Скачиваем файл из Telegram
-            file_path = await download_file(msg.raw_content, MEDIA_DIR, extension)
-
-            # Формируем описание из метаданных (без чтения содержимого)
-            desc_parts = [f"Файл: {original_name}"]
-            if msg.document_mime_type:
-                desc_parts.append(f"Тип: {msg.document_mime_type}")
-            if msg.caption:
-                desc_parts.append(f"Подпись: {msg.caption}")
+        if isinstance(file_path, BaseException):
+            logger.error("Ошибка документа %d: %s", msg.id, file_path)
+            msg.status = "error_doc"
+            continue
 
-            msg.text_content = ". ".join(desc_parts)
-            msg.status = "described"
-            await session.commit()
+        # Формируем описание из метаданных (без чтения содержимого)
+        desc_parts = [f"Файл: {original_name}"]
+        if msg.document_mime_type:
+            desc_parts.append(f"Тип: {msg.document_mime_type}")
+        if msg.caption:
+            desc_parts.append(f"Подпись: {msg.caption}")
 
-            processed_count += 1
-            logger.info("Скачан: %s", file_path)
+        msg.text_content = ". ".join(desc_parts)
+        msg.status = "described"
 
-        except Exception as e:
-            logger.error("Ошибка документа %d: %s", msg.id, e)
-            msg.status = "error_doc"
-            await session.commit()
+        processed_count += 1
+        logger.info("Скачан: %s", file_path)
 
+    await session.commit()
     return processed_count
@@ -1,72 +1,439 @@
+import asyncio
 import json
 import logging
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from collections.abc import Awaitable, Callable
 from pathlib import Path
-from datetime import datetime, timedelta
+from urllib.parse import quote
+from datetime import date, datetime, timedelta
+from functools import lru_cache, partial
+import aiofiles
 import frontmatter as fm
 
 import httpx
+import orjson
 from slugify import slugify
-from sqlalchemy import select
+from sqlalchemy import or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 
 from ..LLMs_calls.calls import llm_process_session
+from ..storage.database import strict_loading
 from ..storage.models import Session, Message
+from ..storage.vault_cache import VaultCache, file_hash
 from src.config import settings
 
 logger = logging.getLogger(__name__)
 
 # ─── Obsidian API ────────────────────────────────────────────────────────────
 
+# Заголовок авторизации собирается один раз при импорте, а не в каждом запросе.
+# Адрес API задан в base_url клиента — пути ниже относительные
+OBSIDIAN_VAULT_URL = "/vault"
+AUTH_HEADERS = {"Authorization": f"Bearer {settings.OBSIDIAN_API_KEY}"}
+
+# Один клиент на все запросы к Local REST API: keep-alive вместо нового
+# TCP/TLS соединения на каждый запрос. http2=True позволяет мультиплексировать
+# запросы в одном соединении, но HTTP/2 согласуется только через TLS (ALPN),
+# поэтому на http:// (порт 27123) клиент работает по HTTP/1.1.
+# Accept-Encoding: gzip, deflate httpx шлёт по умолчанию — ответы-markdown сжимаются.
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Ленивая инициализация общего клиента Obsidian — только при первом вызове."""
+    global _client
+    if _client is None:
+        # Пул соединений и на https: плагин на TLS-порту отвечает по HTTP/1.1, и одно
+        # соединение выстроило бы все параллельные запросы в очередь. Если сервер всё же
+        # согласует HTTP/2, httpcore сам мультиплексирует запросы в одном соединении
+        _client = httpx.AsyncClient(
+            base_url=settings.OBSIDIAN_API_URL,
+            verify=False,
+            timeout=30,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            headers=AUTH_HEADERS,
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Закрывает общий клиент Obsidian (вызывать в конце пайплайна)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    # Следующий прогон читает vault заново
+    _get_cache.clear()
+    _list_cache.clear()
+
+
+# Сколько запросов к Obsidian одновременно держим в полёте из одной пачки
+OBSIDIAN_CONCURRENCY = 8
+
+
+async def gather_limited(coros, limit: int = OBSIDIAN_CONCURRENCY) -> list:
+    """asyncio.gather с ограничением параллельности; исключения возвращаются в результатах."""
+    sem = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with sem:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros), return_exceptions=True)
+
+
+# Повторы на временных сбоях Obsidian: экспоненциальная пауза с jitter, Retry-After в приоритете
+RETRY_ATTEMPTS = 5
+RETRY_INITIAL_DELAY = 0.2
+RETRY_MAX_DELAY = 5.0
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+# POST/PATCH дописывают в файл — повторяем их только если запрос точно не дошёл
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE"})
+
+
+def _retry_delay(attempt: int, r: httpx.Response | None) -> float:
+    retry_after = r.headers.get("Retry-After") if r is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), RETRY_MAX_DELAY)
+        except ValueError:
+            pass  # HTTP-date — считаем сами
+    delay = min(RETRY_MAX_DELAY, RETRY_INITIAL_DELAY * 2 ** attempt)
+    return delay + random.uniform(0, RETRY_INITIAL_DELAY)
+
+
+async def obsidian_request(
+    method: str, url: str, *, stream: bool = False, idempotent: bool | None = None, **kwargs
+) -> httpx.Response:
+    """Запрос к Obsidian с повторами на сетевых ошибках и 429/502/503/504.
+
+    content может быть функцией без аргументов — тогда тело (например, поток
+    из файла) создаётся заново на каждую попытку. idempotent=True помечает
+    повторяемым запрос, неидемпотентный по методу (POST поиска только читает).
+    """
+    client = get_client()
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+    retry_statuses = RETRY_STATUSES if idempotent else frozenset({429})
+    content = kwargs.pop("content", None)
+
+    for attempt in range(RETRY_ATTEMPTS):
+        last_attempt = attempt == RETRY_ATTEMPTS - 1
+        request = client.build_request(
+            method, url, content=content() if callable(content) else content, **kwargs
+        )
+        r: httpx.Response | None = None
+        try:
+            r = await client.send(request, stream=stream)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            error: Exception = e
+        except httpx.TransportError as e:
+            if not idempotent:
+                raise
+            error = e
+        else:
+            if r.status_code not in retry_statuses or last_attempt:
+                return r
+            if stream:
+                await r.aclose()
+
+        if last_attempt:
+            raise error
+        delay = _retry_delay(attempt, r)
+        logger.warning(
+            "Obsidian %s %s: %s — повтор через %.1f с",
+            method, url, r.status_code if r is not None else repr(error), delay,
+        )
+        await asyncio.sleep(delay)
+
+
+async def obsidian_send(method: str, url: str, **kwargs) -> httpx.Response:
+    """Запрос на запись, тело ответа которого не нужно: читаем только статус и заголовки.
+
+    Obsidian отвечает на PUT/POST/PATCH пустым 204, так что соединение сразу
+    возвращается в пул; тело ошибок не скачиваем.
+    """
+    r = await obsidian_request(method, url, stream=True, **kwargs)
+    await r.aclose()
+    return r
+
+
+# ─── TTL-кеш чтений ──────────────────────────────────────────────────────────
+
+# Одни и те же файлы и листинги папок за пачку читаются многократно (поиск
+# related на каждую сессию) — держим ответы CACHE_TTL секунд. Свои записи
+# (create/append/patch) сбрасывают файл и листинг его папки.
+CACHE_TTL = 30.0
+
+
+class TTLCache:
+    """Ответы GET по ключу с временем жизни и ограничением размера.
+
+    Параллельные промахи по одному ключу ждут один и тот же запрос.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = CACHE_TTL) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: dict[str, tuple[float, object]] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable]) -> object:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._fetched, key))
+        # shield: отмена одного ожидающего не обрывает запрос для остальных
+        return await asyncio.shield(task)
+
+    def _fetched(self, key: str, task: asyncio.Future) -> None:
+        # Ключ сброшен записью, пока шёл запрос — ответ уже устарел, не кешируем
+        if self._inflight.get(key) is not task:
+            return
+        del self._inflight[key]
+        if not task.cancelled() and task.exception() is None:
+            self.set(key, task.result())
+
+    def set(self, key: str, value: object) -> None:
+        self._data.pop(key, None)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        while len(self._data) > self.maxsize:
+            del self._data[next(iter(self._data))]
+
+    def pop(self, key: str) -> None:
+        self._data.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._inflight.clear()
+
+
+_get_cache = TTLCache(maxsize=1024)
+_list_cache = TTLCache(maxsize=32)
+
+
+def _invalidate(path: str, value: str | None = None) -> None:
+    """Сбрасывает кеш файла после записи (или кладёт известное содержимое)
+    и листинг его папки — файл мог появиться впервые."""
+    if value is None:
+        _get_cache.pop(path)
+    else:
+        _get_cache.set(path, value)
+    _list_cache.pop(path.rpartition("/")[0])
+
+
+async def _fetch_file(path: str) -> str | None:
+    r = await obsidian_request("GET", f"{OBSIDIAN_VAULT_URL}/{path}")
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    return r.text
+
+
 async def obsidian_get(path: str) -> str | None:
     """Читает файл из vault. Возвращает содержимое или None если не существует."""
-    async with httpx.AsyncClient(verify=False) as client:
-        r = await client.get(
-            f"{settings.OBSIDIAN_API_URL}/vault/{path}",
-            headers={"Authorization": f"Bearer {settings.OBSIDIAN_API_KEY}"},
-        )
-        if r.status_code == 404:
-            return None
-        r.raise_for_status()
-        return r.text
+    return await _get_cache.get_or_fetch(path, partial(_fetch_file, path))
 
 
 async def obsidian_create(path: str, content: str) -> None:
     """Создаёт или полностью заменяет файл в vault."""
-    async with httpx.AsyncClient(verify=False) as client:
-        r = await client.put(
-            f"{settings.OBSIDIAN_API_URL}/vault/{path}",
-            headers={
-                "Authorization": f"Bearer {settings.OBSIDIAN_API_KEY}",
-                "Content-Type": "text/markdown",
-            },
-            content=content.encode("utf-8"),
-        )
-        r.raise_for_status()
+    _invalidate(path)
+    r = await obsidian_send(
+        "PUT",
+        f"{OBSIDIAN_VAULT_URL}/{path}",
+        headers={"Content-Type": "text/markdown"},
+        content=content.encode("utf-8"),
+    )
+    r.raise_for_status()
+    # Содержимое известно — следующий GET обойдётся без запроса
+    _invalidate(path, content)
 
 
 async def obsidian_append(path: str, content: str) -> None:
-    """Добавляет контент в конец существующего файла."""
-    existing = await obsidian_get(path)
-    if existing is None:
-        await obsidian_create(path, content)
-    else:
-        await obsidian_create(path, existing + "\n" + content)
+    """Дописывает content в конец файла (файл создаётся, если его нет).
+
+    POST /vault/{path} — по сети идёт только добавляемый фрагмент, без
+    скачивания и перезаписи всего файла.
+    """
+    _invalidate(path)
+    r = await obsidian_send(
+        "POST",
+        f"{OBSIDIAN_VAULT_URL}/{path}",
+        headers={"Content-Type": "text/markdown"},
+        content=content.encode("utf-8"),
+    )
+    if r.status_code == 405:
+        # Версия плагина без append — читаем и перезаписываем целиком
+        existing = await obsidian_get(path)
+        await obsidian_create(path, (existing or "") + content)
+        return
+    r.raise_for_status()
+
+
+async def obsidian_patch_heading(
+    path: str, heading: str, content: str, operation: str = "append"
+) -> bool:
+    """Дописывает content в конец секции заголовка (PATCH, Target-Type: heading),
+    а с operation="replace" — заменяет им тело секции.
+
+    heading — путь заголовка через '::', как его адресует плагин ("Семья::Друзья").
+    Возвращает False, если PATCH не поддерживается или заголовок не найден.
+    """
+    _invalidate(path)
+    r = await obsidian_send(
+        "PATCH",
+        f"{OBSIDIAN_VAULT_URL}/{path}",
+        headers={
+            "Content-Type": "text/markdown",
+            "Operation": operation,
+            "Target-Type": "heading",
+            # Нелатинские заголовки плагин принимает только URL-encoded
+            "Target": quote(heading),
+        },
+        content=content.encode("utf-8"),
+    )
+    if r.status_code in (400, 404, 405):
+        logger.debug("PATCH %s [%s] не применён: %s", path, heading, r.status_code)
+        return False
+    r.raise_for_status()
+    return True
+
+
+async def obsidian_patch_frontmatter(path: str, key: str, values: list[str]) -> bool:
+    """Дописывает values в список frontmatter-поля key (PATCH, Target-Type: frontmatter).
+
+    Поле создаётся, если его нет. Возвращает False, если PATCH не поддерживается
+    или плагин не смог применить его к файлу.
+    """
+    _invalidate(path)
+    r = await obsidian_send(
+        "PATCH",
+        f"{OBSIDIAN_VAULT_URL}/{path}",
+        headers={
+            "Content-Type": "application/json",
+            "Operation": "append",
+            "Target-Type": "frontmatter",
+            "Target": quote(key),
+            "Create-Target-If-Missing": "true",
+        },
+        content=orjson.dumps(values),
+    )
+    if r.status_code in (400, 404, 405):
+        logger.debug("PATCH %s [frontmatter %s] не применён: %s", path, key, r.status_code)
+        return False
+    r.raise_for_status()
+    return True
+
+
+_HEADING_RE = re.compile(r"^(#{1,6}) +(.+?)[ \t]*$", re.M)
+
+
+def heading_spans(content: str) -> dict[str, tuple[int, int]]:
+    """{путь заголовка 'H1::H2': (начало тела секции, конец секции)} — тело начинается
+    со строки после заголовка, секция идёт до следующего заголовка того же или более
+    высокого уровня."""
+    heads = [(len(m.group(1)), m.group(2), m.start(), m.end()) for m in _HEADING_RE.finditer(content)]
+    sections: dict[str, tuple[int, int]] = {}
+    stack: list[tuple[int, str]] = []
+    for i, (level, title, _, line_end) in enumerate(heads):
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+        stack.append((level, title))
+        end = next((start for lvl, _, start, _ in heads[i + 1:] if lvl <= level), len(content))
+        sections.setdefault("::".join(t for _, t in stack), (min(line_end + 1, end), end))
+    return sections
+
+
+def heading_sections(content: str) -> dict[str, int]:
+    """{путь заголовка 'H1::H2': позиция конца его секции}."""
+    return {heading: end for heading, (_, end) in heading_spans(content).items()}
+
+
+def tail_delta(content: str, addition: str) -> str | None:
+    """Фрагмент для obsidian_append, дающий ровно content.rstrip() + addition.
+
+    Хвостовые пробельные символы content должны быть началом addition — тогда они
+    уже стоят в файле и не дублируются. Иначе (пробелы в конце, лишние пустые строки)
+    дозаписью того же результата не получить — None.
+    """
+    trailing = content[len(content.rstrip()):]
+    if not addition.startswith(trailing):
+        return None
+    return addition[len(trailing):]
+
+
+async def attachment_digest(local_path: Path, cache: VaultCache | None) -> str | None:
+    """blake2b вложения — только если есть где сверить его с прошлой загрузкой."""
+    if cache is None:
+        return None
+    return await asyncio.to_thread(file_hash, local_path)
+
+
+async def obsidian_attachment_unchanged(
+    path: str, local_path: Path, digest: str | None, cache: VaultCache | None
+) -> bool:
+    """В vault уже лежит это же вложение — повторно не грузим.
+
+    Имена вложений не выводятся из содержимого (подпись фото, имя документа),
+    поэтому одного размера мало: хеш файла должен совпасть с хешем нашей прошлой
+    загрузки по этому пути, а HEAD — подтвердить, что файл на месте и того же размера.
+    Срабатывает при повторной обработке сессии (error_obsidian).
+    """
+    if digest is None or cache is None or cache.get_attachment_hash(path) != digest:
+        return False
+    try:
+        r = await obsidian_request("HEAD", f"{OBSIDIAN_VAULT_URL}/{path}")
+    except httpx.HTTPError:
+        return False
+    if r.status_code != 200:
+        return False
+    return int(r.headers.get("Content-Length", -1)) == local_path.stat().st_size
+
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
 
 
-async def obsidian_upload_image(photo_path: Path, filename: str) -> None:
+async def iter_file(path: Path, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """Читает файл кусками — тело запроса отдаётся потоком, не целиком в памяти."""
+    async with aiofiles.open(path, "rb") as f:
+        while chunk := await f.read(chunk_size):
+            yield chunk
+
+
+async def obsidian_upload_image(
+    photo_path: Path, filename: str, cache: VaultCache | None = None
+) -> None:
     """Загружает изображение в vault/attachments/photos/."""
-    async with httpx.AsyncClient(verify=False, timeout=30) as client:
-        with open(photo_path, "rb") as f:
-            r = await client.put(
-                f"{settings.OBSIDIAN_API_URL}/vault/attachments/photos/{filename}",
-                headers={
-                    "Authorization": f"Bearer {settings.OBSIDIAN_API_KEY}",
-                    "Content-Type": "image/jpeg",
-                },
-                content=f.read(),
-            )
-            r.raise_for_status()
-    logger.info("Загружено фото: attachments/photos/%s", filename)
+    path = f"attachments/photos/{filename}"
+    digest = await attachment_digest(photo_path, cache)
+    if await obsidian_attachment_unchanged(path, photo_path, digest, cache):
+        logger.info("Фото уже в vault: %s", path)
+        return
+
+    # Content-Length задаём сами, иначе httpx отправит поток chunked
+    r = await obsidian_send(
+        "PUT",
+        f"{OBSIDIAN_VAULT_URL}/{path}",
+        headers={
+            "Content-Type": "image/jpeg",
+            "Content-Length": str(photo_path.stat().st_size),
+        },
+        content=partial(iter_file, photo_path),
+    )
+    r.raise_for_status()
+    if digest is not None:
+        cache.set_attachment_hash(path, digest)
+    logger.info("Загружено фото: %s (%s)", path, r.http_version)
 
 
 MIME_MAP = {
@@ -84,23 +451,32 @@ MIME_MAP = {
 }
 
 
-async def obsidian_upload_document(doc_path: Path, filename: str) -> None:
+async def obsidian_upload_document(
+    doc_path: Path, filename: str, cache: VaultCache | None = None
+) -> None:
     """Загружает документ в vault/attachments/documents/."""
     suffix = Path(filename).suffix.lower()
     content_type = MIME_MAP.get(suffix, "application/octet-stream")
+    path = f"attachments/documents/{filename}"
+    digest = await attachment_digest(doc_path, cache)
+    if await obsidian_attachment_unchanged(path, doc_path, digest, cache):
+        logger.info("Документ уже в vault: %s", path)
+        return
 
-    async with httpx.AsyncClient(verify=False, timeout=30) as client:
-        with open(doc_path, "rb") as f:
-            r = await client.put(
-                f"{settings.OBSIDIAN_API_URL}/vault/attachments/documents/{filename}",
-                headers={
-                    "Authorization": f"Bearer {settings.OBSIDIAN_API_KEY}",
-                    "Content-Type": content_type,
-                },
-                content=f.read(),
-            )
-            r.raise_for_status()
-    logger.info("Загружен документ: attachments/documents/%s", filename)
+    # Документ может весить десятки мегабайт — шлём потоком, как фото
+    r = await obsidian_send(
+        "PUT",
+        f"{OBSIDIAN_VAULT_URL}/{path}",
+        headers={
+            "Content-Type": content_type,
+            "Content-Length": str(doc_path.stat().st_size),
+        },
+        content=partial(iter_file, doc_path),
+    )
+    r.raise_for_status()
+    if digest is not None:
+        cache.set_attachment_hash(path, digest)
+    logger.info("Загружен документ: %s (%s)", path, r.http_version)
 
 
 async def obsidian_list_files(folder: str) -> list[str]:
@@ -109,78 +485,295 @@ async def obsidian_list_files(folder: str) -> list[str]:
     Obsidian Local REST API возвращает имена файлов без префикса папки,
     поэтому мы добавляем folder/ к каждому пути.
     """
-    async with httpx.AsyncClient(verify=False) as client:
-        r = await client.get(
-            f"{settings.OBSIDIAN_API_URL}/vault/{folder}/",
-            headers={"Authorization": f"Bearer {settings.OBSIDIAN_API_KEY}"},
+    # Копия — вызывающий код может менять список, не портя кеш
+    return list(await _list_cache.get_or_fetch(folder, partial(_fetch_listing, folder)))
+
+
+async def _fetch_listing(folder: str) -> list[str]:
+    r = await obsidian_request("GET", f"{OBSIDIAN_VAULT_URL}/{folder}/")
+    if r.status_code == 404:
+        return []
+    r.raise_for_status()
+    data = r.json()
+    files = data.get("files", [])
+    result = []
+    for item in files:
+        path = item if isinstance(item, str) else item.get("path", "")
+        if path.endswith(".md"):
+            # API возвращает имена без папки — добавляем prefix
+            if not path.startswith(f"{folder}/"):
+                path = f"{folder}/{path}"
+            result.append(path)
+    return result
+
+
+# ─── Буфер системных файлов ──────────────────────────────────────────────────
+
+CURRENT_CONTEXT_FILE = "_system/CURRENT_CONTEXT.md"
+TAGS_GLOSSARY_FILE = "_system/TAGS_GLOSSARY.md"
+FAMILY_MEMORY_FILE = "_system/FAMILY_MEMORY.md"
+
+
+# Сюда сохраняется несброшенный буфер, если прогон упал до записи в vault
+PENDING_SYSTEM_UPDATES = Path("media/pending_system_updates.json")
+
+
+def _write_pending(path: Path, state: str | None) -> None:
+    if state is None:
+        path.unlink(missing_ok=True)
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(state, encoding="utf-8")
+
+
+def _str_list(value: object) -> list[str]:
+    return [str(v) for v in value] if isinstance(value, list) else []
+
+
+class SystemFileBuffer:
+    """Системные файлы _system/*.md на время прогона: один GET на файл для контекста,
+    запись — в flush().
+
+    add_*() копят изменения памяти (контекст, теги, люди, интересы) за весь прогон,
+    flush() перечитывает изменяемые файлы, применяет к ним изменения и пишет одним
+    запросом на файл:
+    set() заменяет файл целиком (PUT), append() дописывает в конец файла (POST)
+    или в конец секции заголовка (PATCH), replace_section() заменяет тело секции (PATCH).
+    """
+
+    def __init__(self) -> None:
+        self.context_entries: list[str] = []
+        self.new_tags: list[str] = []
+        self.new_people: list[str] = []
+        self.interests: dict[str, list[str]] = {}
+        self._content: dict[str, str | None] = {}
+        # path → [(операция PATCH, путь заголовка или "", фрагмент)]
+        self._patches: dict[str, list[tuple[str, str, str]]] = {}
+        self._rewrite: set[str] = set()
+        # Сохранения из параллельных сессий пишут один файл — по очереди
+        self._save_lock = asyncio.Lock()
+
+    # ── Накопление изменений ──
+
+    def add_context(
+        self, context_summary: str, filename: str = "", tags: list[str] | None = None
+    ) -> None:
+        if context_summary:
+            self.context_entries.append(format_context_entry(context_summary, filename, tags))
+
+    def add_tags(self, tags: list[str]) -> None:
+        for tag in tags:
+            if tag not in self.new_tags:
+                self.new_tags.append(tag)
+
+    def add_people(self, people: list[str]) -> None:
+        for person in people:
+            if person and person not in self.new_people:
+                self.new_people.append(person)
+
+    def add_interests(self, author_name: str, interests: list[str]) -> None:
+        if interests:
+            self.interests.setdefault(author_name, []).extend(interests)
+
+    def is_empty(self) -> bool:
+        return not (self.context_entries or self.new_tags or self.new_people or self.interests)
+
+    async def save(self, path: Path = PENDING_SYSTEM_UPDATES) -> None:
+        """Сохраняет несброшенные изменения на диск для повтора при следующем запуске.
+
+        Снимок берётся сразу, файл пишется в потоке — event loop не ждёт диска.
+        """
+        state = None if self.is_empty() else json.dumps(
+            {
+                "context_entries": self.context_entries,
+                "new_tags": self.new_tags,
+                "new_people": self.new_people,
+                "interests": self.interests,
+            },
+            ensure_ascii=False,
         )
-        if r.status_code == 404:
-            return []
-        r.raise_for_status()
-        data = r.json()
-        files = data.get("files", [])
-        result = []
-        for item in files:
-            path = item if isinstance(item, str) else item.get("path", "")
-            if path.endswith(".md"):
-                # API возвращает имена без папки — добавляем prefix
-                if not path.startswith(f"{folder}/"):
-                    path = f"{folder}/{path}"
-                result.append(path)
-        return result
+        async with self._save_lock:
+            await asyncio.to_thread(_write_pending, path, state)
+
+    @classmethod
+    def restore(cls, path: Path = PENDING_SYSTEM_UPDATES) -> "SystemFileBuffer":
+        """Создаёт буфер, подхватывая изменения, не записанные прошлым прогоном."""
+        buffer = cls()
+        if not path.exists():
+            return buffer
+        try:
+            state = json.loads(path.read_text(encoding="utf-8"))
+            if not isinstance(state, dict):
+                raise ValueError(f"ожидался объект, получен {type(state).__name__}")
+            # Поля переносим поимённо через add_*: лишние ключи и значения не того
+            # типа из файла в буфер не попадают
+            buffer.context_entries.extend(_str_list(state.get("context_entries")))
+            buffer.add_tags(_str_list(state.get("new_tags")))
+            buffer.add_people(_str_list(state.get("new_people")))
+            interests = state.get("interests")
+            if isinstance(interests, dict):
+                for author_name, author_interests in interests.items():
+                    buffer.add_interests(str(author_name), _str_list(author_interests))
+            logger.info("Восстановлен буфер системных файлов: %s", path)
+        except (ValueError, OSError) as e:
+            logger.warning("Не удалось прочитать %s: %s", path, e)
+        return buffer
+
+    # ── Содержимое файлов ──
+
+    async def get(self, path: str) -> str | None:
+        if path not in self._content:
+            self._content[path] = await obsidian_get(path)
+        return self._content[path]
+
+    def set(self, path: str, content: str) -> None:
+        self._content[path] = content
+        self._rewrite.add(path)
+        self._patches.pop(path, None)
+
+    def extend(self, path: str, addition: str) -> None:
+        """Делает файл равным content.rstrip() + addition: дозаписью, если хвост
+        файла это позволяет, иначе полной перезаписью."""
+        content = self._content.get(path) or ""
+        delta = tail_delta(content, addition)
+        if delta is None:
+            self.set(path, content.rstrip() + addition)
+        else:
+            self.append(path, delta)
+
+    def append(self, path: str, delta: str, heading: str = "") -> None:
+        """Дописывает delta в конец файла или, если задан heading, в конец его секции."""
+        content = self._content.get(path) or ""
+        end = heading_sections(content).get(heading) if heading else None
+        if end is None:
+            heading = ""
+            self._content[path] = content + delta
+        else:
+            before, after = content[:end].rstrip("\n"), content[end:]
+            self._content[path] = f"{before}\n{delta.rstrip()}\n" + (f"\n{after}" if after else "")
+        if path not in self._rewrite:
+            self._patches.setdefault(path, []).append(("append", heading, delta))
+
+    def replace_section(self, path: str, heading: str, content: str) -> None:
+        """Файл становится content, отличающимся от текущего только телом секции
+        heading, — в vault уходит одно это тело."""
+        start, end = heading_spans(content)[heading]
+        self._content[path] = content
+        if path not in self._rewrite:
+            self._patches.setdefault(path, []).append(("replace", heading, content[start:end]))
+
+    async def _reload(self, paths: list[str]) -> None:
+        """Перечитывает файлы из vault (без кеша) и сбрасывает несписанные правки к ним."""
+        contents = await asyncio.gather(*(_fetch_file(p) for p in paths))
+        for path, content in zip(paths, contents):
+            self._content[path] = content
+            self._rewrite.discard(path)
+            self._patches.pop(path, None)
+
+    # ── Запись в vault ──
+
+    async def _write(self, path: str) -> None:
+        if path in self._rewrite:
+            await obsidian_create(path, self._content[path])
+            return
+        for operation, heading, fragment in self._patches[path]:
+            if not heading:
+                await obsidian_append(path, fragment)
+            elif not await obsidian_patch_heading(path, heading, fragment, operation):
+                # PATCH не сработал — перезаписываем файл целиком из кеша
+                await obsidian_create(path, self._content[path])
+                return
+
+    async def _write_changed(self) -> dict[str, BaseException]:
+        """Пишет изменённые файлы параллельно. Возвращает ошибки по путям."""
+        paths = list(self._rewrite | self._patches.keys())
+        results = await asyncio.gather(
+            *(self._write(p) for p in paths),
+            return_exceptions=True,
+        )
+        errors: dict[str, BaseException] = {}
+        for p, res in zip(paths, results):
+            if isinstance(res, BaseException):
+                errors[p] = res
+            else:
+                self._rewrite.discard(p)
+                self._patches.pop(p, None)
+        return errors
+
+    async def flush(self, path: Path = PENDING_SYSTEM_UPDATES) -> None:
+        """Пишет накопленное в vault. Каждый файл очищается из буфера после записи,
+        поэтому при ошибке на диск сохраняется только недописанное.
+
+        Копия из load_base_context могла устареть за прогон (файл правили в Obsidian),
+        поэтому изменяемые файлы перечитываются мимо кеша — перезапись не затрёт правки.
+        """
+        try:
+            await self._reload([
+                file for file, pending in (
+                    (CURRENT_CONTEXT_FILE, self.context_entries),
+                    (TAGS_GLOSSARY_FILE, self.new_tags),
+                    (FAMILY_MEMORY_FILE, self.new_people or self.interests),
+                ) if pending
+            ])
+            await update_current_context(self.context_entries, self)
+            await update_tags_glossary(self.new_tags, self)
+            await update_family_memory(self.new_people, self.interests, self)
+            # Три разных файла — пишем параллельно
+            errors = await self._write_changed()
+            if CURRENT_CONTEXT_FILE not in errors:
+                self.context_entries = []
+            if TAGS_GLOSSARY_FILE not in errors:
+                self.new_tags = []
+            if FAMILY_MEMORY_FILE not in errors:
+                self.new_people = []
+                self.interests = {}
+            if errors:
+                raise next(iter(errors.values()))
+        finally:
+            await self.save(path)
 
 
 # ─── Загрузка системных файлов ───────────────────────────────────────────────
 
-async def load_system_file(filename: str) -> str:
-    """Загружает системный md файл из _system/ папки vault."""
-    content = await obsidian_get(f"_system/{filename}")
+async def load_system_file(filename: str, files: SystemFileBuffer | None = None) -> str:
+    """Загружает системный md файл из _system/ папки vault (через кеш, если передан)."""
+    path = f"_system/{filename}"
+    content = await (files.get(path) if files else obsidian_get(path))
     return content or f"# {filename}\n(file not found)"
 
 
+# Заголовок секции CURRENT_CONTEXT: ## YYYY-MM-DD (любой ## тоже закрывает секцию)
+_SECTION_RE = re.compile(r"^## (.*)$", re.M)
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
 def parse_current_context(content: str) -> str:
     """Парсит CURRENT_CONTEXT.md и возвращает только записи новее CONTEXT_MEMORY_DAYS."""
-    cutoff = datetime.now() - timedelta(days=settings.CONTEXT_MEMORY_DAYS)
-    lines = content.split("\n")
+    # ISO-даты сравниваются как строки — strptime на каждый заголовок не нужен
+    cutoff = (datetime.now() - timedelta(days=settings.CONTEXT_MEMORY_DAYS)).strftime("%Y-%m-%d")
 
+    # split с группой: [до первого ##, заголовок1, тело1, заголовок2, тело2, ...]
+    parts = _SECTION_RE.split(content)
     result = []
-    current_section_date = None
-    current_section_lines = []
-    include_section = False
-
-    for line in lines:
-        # Ищем заголовки вида ## YYYY-MM-DD
-        if line.startswith("## "):
-            # Сохраняем предыдущую секцию если она попала в окно
-            if include_section and current_section_lines:
-                result.extend(current_section_lines)
-
-            # Парсим дату новой секции
-            date_str = line.replace("## ", "").strip()
-            try:
-                current_section_date = datetime.strptime(date_str, "%Y-%m-%d")
-                include_section = current_section_date >= cutoff
-            except ValueError:
-                include_section = False
-
-            current_section_lines = [line]
-
-        elif current_section_date is not None:
-            current_section_lines.append(line)
-
-    # Не забываем последнюю секцию
-    if include_section and current_section_lines:
-        result.extend(current_section_lines)
+    for header, body in zip(parts[1::2], parts[2::2]):
+        section_date = header.strip()
+        if not _ISO_DATE_RE.fullmatch(section_date):
+            continue
+        if section_date >= cutoff:
+            result.append(f"## {header}{body}")
 
-    return "\n".join(result) if result else "(no recent context)"
+    return "".join(result) if result else "(no recent context)"
 
 
-async def load_base_context() -> dict[str, str]:
+async def load_base_context(files: SystemFileBuffer | None = None) -> dict[str, str]:
     """Загружает общие системные файлы (без intent-specific)."""
-    agent_config = await load_system_file("AGENT_CONFIG.md")
-    family_memory = await load_system_file("FAMILY_MEMORY.md")
-    tags_glossary = await load_system_file("TAGS_GLOSSARY.md")
-    current_context_raw = await load_system_file("CURRENT_CONTEXT.md")
+    # Четыре независимых GET — параллельно, задержка = max, а не сумма
+    agent_config, family_memory, tags_glossary, current_context_raw = await asyncio.gather(
+        load_system_file("AGENT_CONFIG.md", files),
+        load_system_file("FAMILY_MEMORY.md", files),
+        load_system_file("TAGS_GLOSSARY.md", files),
+        load_system_file("CURRENT_CONTEXT.md", files),
+    )
     current_context = parse_current_context(current_context_raw)
 
     return {
@@ -193,9 +786,11 @@ async def load_base_context() -> dict[str, str]:
 
 async def load_context(intent: str = "note") -> dict[str, str]:
     """Загружает все системные файлы + intent-specific правила."""
-    base = await load_base_context()
-    # Загружаем intent-specific правила (если файл не найден — пустая строка)
-    intent_config = await load_system_file(f"intents/{intent}.md")
+    # Intent-specific правила грузим вместе с базовыми (если файл не найден — пустая строка)
+    base, intent_config = await asyncio.gather(
+        load_base_context(),
+        load_system_file(f"intents/{intent}.md"),
+    )
     if "(file not found)" in intent_config:
         intent_config = ""
     return {**base, "intent_config": intent_config}
@@ -203,24 +798,38 @@ async def load_context(intent: str = "note") -> dict[str, str]:
 
 # ─── Определение автора ──────────────────────────────────────────────────────
 
-def resolve_author(author_id: int, family_memory: str) -> str:
-    """Ищет имя автора в FAMILY_MEMORY по Telegram ID."""
-    blocks = family_memory.split("### ")
-    for block in blocks:
-        if str(author_id) in block:
-            name = block.split("\n")[0].strip()
-            if name:
-                return name
+# Блок человека в FAMILY_MEMORY: ### Имя и всё до следующего ###
+_PERSON_BLOCK_RE = re.compile(r"^### ([^\n]+)\n(.*?)(?=\n### |\Z)", re.M | re.S)
+# Telegram ID — от 5 цифр; возраст, годы и даты в блоке в индекс не попадают
+_TELEGRAM_ID_RE = re.compile(r"\b\d{5,}\b")
 
-    return f"user_{author_id}"
+
+def build_author_index(family_memory: str) -> dict[int, str]:
+    """Строит {telegram_id: имя} по FAMILY_MEMORY за один проход.
+
+    ID — число от 5 цифр целым словом внутри блока ### Имя; при повторе побеждает первый блок.
+    """
+    authors: dict[int, str] = {}
+    for m in _PERSON_BLOCK_RE.finditer(family_memory):
+        name = m.group(1).strip()
+        if not name:
+            continue
+        for number in _TELEGRAM_ID_RE.findall(m.group(2)):
+            authors.setdefault(int(number), name)
+    return authors
+
+
+def resolve_author(author_id: int, authors: dict[int, str]) -> str:
+    """Имя автора по Telegram ID из индекса build_author_index."""
+    return authors.get(author_id, f"user_{author_id}")
 
 
 # ─── Генерация имён файлов ────────────────────────────────────────────────
 
-RUSSIAN_MONTHS = [
+RUSSIAN_MONTHS = (
     "янв", "фев", "мар", "апр", "май", "июн",
     "июл", "авг", "сен", "окт", "ноя", "дек",
-]
+)
 
 INTENT_FOLDERS = {
     "note": "notes",
@@ -230,11 +839,23 @@ INTENT_FOLDERS = {
 }
 
 
-def get_monday_of_week(dt: datetime) -> datetime:
+def get_monday_of_week(dt: date) -> date:
     """Возвращает понедельник недели, содержащей dt."""
     return dt - timedelta(days=dt.weekday())
 
 
+@lru_cache(maxsize=1024)
+def _slug(title: str) -> str:
+    """slugify заголовка; в пачке заголовки часто повторяются — кешируем."""
+    return slugify(title, max_length=50, separator="_")
+
+
+@lru_cache(maxsize=512)
+def _date_part(day: date) -> str:
+    """27-фев-26 — дата в имени файла."""
+    return f"{day.day:02d}-{RUSSIAN_MONTHS[day.month - 1]}-{day.year % 100:02d}"
+
+
 def generate_filename(title: str, intent: str, created_at: datetime) -> str:
     """Генерирует путь файла в Obsidian vault.
 
@@ -244,36 +865,32 @@ def generate_filename(title: str, intent: str, created_at: datetime) -> str:
       calendar/Slug_27-фев-26.md          (отдельный файл на событие)
       tasks/неделя_24-фев-26.md           (один файл на неделю, дата = понедельник)
     """
+    # Время в имя файла не входит — кешируем по дате
+    return _generate_filename(title, intent, created_at.date())
+
+
+@lru_cache(maxsize=1024)
+def _generate_filename(title: str, intent: str, day: date) -> str:
     folder = INTENT_FOLDERS.get(intent, "notes")
 
     # Календарь: отдельный файл на каждое событие (как notes)
     if intent == "calendar":
-        slug = slugify(title, max_length=50, separator="_")
+        slug = _slug(title)
         slug_display = (slug[0].upper() + slug[1:]) if slug else "Sobytie"
-        day = f"{created_at.day:02d}"
-        month = RUSSIAN_MONTHS[created_at.month - 1]
-        year = f"{created_at.year % 100:02d}"
-        return f"{folder}/{slug_display}_{day}-{month}-{year}.md"
+        return f"{folder}/{slug_display}_{_date_part(day)}.md"
 
     # Задания: один файл на неделю (дата = понедельник)
     if intent == "task":
-        monday = get_monday_of_week(created_at)
-        day = f"{monday.day:02d}"
-        month = RUSSIAN_MONTHS[monday.month - 1]
-        year = f"{monday.year % 100:02d}"
-        return f"{folder}/неделя_{day}-{month}-{year}.md"
+        return f"{folder}/неделя_{_date_part(get_monday_of_week(day))}.md"
 
-    day = f"{created_at.day:02d}"
-    month = RUSSIAN_MONTHS[created_at.month - 1]
-    year = f"{created_at.year % 100:02d}"
-    date_part = f"{day}-{month}-{year}"
+    date_part = _date_part(day)
 
     if intent == "diary":
         # Дневник: без времени — один файл на день, append по дате
         return f"{folder}/{date_part}_дневник.md"
 
     # note и любой fallback — slug первым, дата после, время в frontmatter
-    slug = slugify(title, max_length=50, separator="_")
+    slug = _slug(title)
     if not slug:
         slug = "zametka"
     # Первая буква slug с заглавной для читаемости
@@ -283,63 +900,60 @@ def generate_filename(title: str, intent: str, created_at: datetime) -> str:
 
 # ─── Обновление системных файлов ──────────────────────────────────────────
 
-async def update_current_context(
+def format_context_entry(
     context_summary: str, filename: str = "", tags: list[str] | None = None
-) -> None:
-    """Добавляет краткое описание записи в CURRENT_CONTEXT.md.
+) -> str:
+    """Формирует строку для CURRENT_CONTEXT.md: [filename] (теги) Описание...
 
-    Формат: - [filename] (теги) Описание...
     Это позволяет LLM видеть имена файлов и ставить related.
     """
-    if not context_summary:
-        return
-
-    # Формируем строку с filename и тегами для LLM
     tags_str = f" ({', '.join(tags)})" if tags else ""
-    entry = f"[{filename}]{tags_str} {context_summary}" if filename else context_summary
+    return f"[{filename}]{tags_str} {context_summary}" if filename else context_summary
 
-    path = "_system/CURRENT_CONTEXT.md"
-    content = await obsidian_get(path)
-    today_header = f"## {datetime.now().strftime('%Y-%m-%d')}"
 
-    if content is None:
-        content = f"# Current Context\n\n{today_header}\n- {entry}\n"
-        await obsidian_create(path, content)
+async def update_current_context(entries: list[str], files: SystemFileBuffer) -> None:
+    """Добавляет записи в CURRENT_CONTEXT.md под заголовок текущего дня."""
+    if not entries:
         return
 
-    if today_header in content:
-        content = content.rstrip() + f"\n- {entry}\n"
+    path = CURRENT_CONTEXT_FILE
+    content = await files.get(path)
+    today_header = f"## {datetime.now().strftime('%Y-%m-%d')}"
+    new_lines = "\n".join(f"- {entry}" for entry in entries)
+
+    if content is None:
+        files.set(path, f"# Current Context\n\n{today_header}\n{new_lines}\n")
+    elif today_header in content:
+        files.extend(path, f"\n{new_lines}\n")
     else:
-        content = content.rstrip() + f"\n\n{today_header}\n- {entry}\n"
+        files.extend(path, f"\n\n{today_header}\n{new_lines}\n")
+    logger.info("Обновлён CURRENT_CONTEXT: %d записей", len(entries))
+
 
-    await obsidian_create(path, content)
-    logger.info("Обновлён CURRENT_CONTEXT: %s...", entry[:80])
+# Тег в тексте глоссария: отдельное слово #тег (не заголовок ##); хвостовые «—:,.»
+# не входят в тег — как word.rstrip("—:,.") в построчном разборе
+_TAG_RE = re.compile(r"(?<!\S)#(?!#)(\S*?)[—:,.]*(?!\S)")
 
 
-async def update_tags_glossary(tags: list[str]) -> None:
+async def update_tags_glossary(tags: list[str], files: SystemFileBuffer) -> None:
     """Добавляет новые теги в TAGS_GLOSSARY.md в секцию 'Автодобавленные'."""
     if not tags:
         return
 
-    path = "_system/TAGS_GLOSSARY.md"
-    content = await obsidian_get(path)
+    path = TAGS_GLOSSARY_FILE
+    content = await files.get(path)
     if content is None:
         return
 
-    # Собираем существующие теги (нормализуем — убираем #)
-    existing_tags = set()
-    for line in content.split("\n"):
-        for word in line.strip().split():
-            if word.startswith("#") and not word.startswith("##"):
-                existing_tags.add(_normalize_tag(word.rstrip("—:,.")))
-
-    # Нормализуем входные теги и фильтруем уже существующие
-    new_tags = []
-    for t in tags:
-        normalized = _normalize_tag(t)
-        if normalized and normalized not in existing_tags:
-            new_tags.append(normalized)
-            existing_tags.add(normalized)  # предотвращаем дубли внутри пачки
+    # Собираем существующие теги одним проходом регулярки (без #)
+    existing_tags = set(_TAG_RE.findall(content))
+
+    # Нормализуем входные теги, убираем дубли внутри пачки (с сохранением порядка)
+    # и уже существующие
+    new_tags = [
+        t for t in dict.fromkeys(map(_normalize_tag, tags))
+        if t and t not in existing_tags
+    ]
 
     if not new_tags:
         return
@@ -348,119 +962,176 @@ async def update_tags_glossary(tags: list[str]) -> None:
     new_lines = "\n".join(f"- #{tag}" for tag in new_tags)
 
     if auto_section in content:
-        content = content.rstrip() + "\n" + new_lines + "\n"
+        addition = f"\n{new_lines}\n"
     else:
-        content = content.rstrip() + f"\n\n{auto_section}\n{new_lines}\n"
+        addition = f"\n\n{auto_section}\n{new_lines}\n"
 
-    await obsidian_create(path, content)
+    files.extend(path, addition)
     logger.info("Новые теги в глоссарии: %s", new_tags)
 
 
-async def update_user_interests(author_name: str, interests: list[str]) -> None:
-    """Обновляет интересы пользователя в FAMILY_MEMORY.md.
+@lru_cache(maxsize=64)
+def _author_heading_re(author_name: str) -> re.Pattern[str]:
+    """Строка-заголовок блока ### {author_name} (пробелы по краям допускаются)."""
+    return re.compile(rf"^[ \t]*### {re.escape(author_name)}[ \t]*$", re.M)
+
+
+# Начало следующего блока (### Имя или ## Раздел) — конец блока автора
+_BLOCK_END_RE = re.compile(r"^(?:### |## )", re.M)
+_INTERESTS_LINE_RE = re.compile(r"^[ \t]*- Интересы:(.*)$", re.M)
+
+
+def merge_user_interests(content: str, author_name: str, interests: list[str]) -> str:
+    """Сливает интересы пользователя в текст FAMILY_MEMORY.md.
 
     Ищет блок ### {author_name}, находит строку '- Интересы:',
-    сливает новые с существующими (max 10).
+    сливает новые с существующими (max 10). Возвращает обновлённый текст.
     """
     if not interests:
-        return
-
-    path = "_system/FAMILY_MEMORY.md"
-    content = await obsidian_get(path)
-    if content is None:
-        return
+        return content
 
-    # Ищем блок автора
-    marker = f"### {author_name}"
-    if marker not in content:
-        return
+    # Ищем блок автора: от заголовка до следующего ###/## заголовка
+    heading = _author_heading_re(author_name).search(content)
+    if heading is None:
+        return content
+    block_end = _BLOCK_END_RE.search(content, heading.end())
+    line = _INTERESTS_LINE_RE.search(
+        content, heading.end(), block_end.start() if block_end else len(content)
+    )
 
     # Парсим существующие интересы
-    lines = content.split("\n")
-    interests_line_idx = None
-    existing_interests: list[str] = []
-
-    in_author_block = False
-    for i, line in enumerate(lines):
-        if line.strip() == marker:
-            in_author_block = True
-            continue
-        if in_author_block:
-            if line.startswith("### ") or line.startswith("## "):
-                break  # Вышли из блока автора
-            if line.strip().startswith("- Интересы:"):
-                interests_line_idx = i
-                raw = line.split(":", 1)[1].strip()
-                existing_interests = [x.strip() for x in raw.split(",") if x.strip()]
-                break
+    existing_interests = (
+        [x.strip() for x in line.group(1).split(",") if x.strip()] if line else []
+    )
 
     # Сливаем новые с существующими (дедупликация, max 10)
     merged = list(dict.fromkeys(existing_interests + interests))[:10]
     if set(merged) == set(existing_interests):
-        return  # Нечего обновлять
+        return content  # Нечего обновлять
 
     interests_str = ", ".join(merged)
     new_line = f"- Интересы: {interests_str}"
 
-    if interests_line_idx is not None:
-        lines[interests_line_idx] = new_line
-    else:
-        # Нет строки интересов — добавляем после маркера автора
-        for i, line in enumerate(lines):
-            if line.strip() == marker:
-                lines.insert(i + 1, new_line)
-                break
-
-    await obsidian_create(path, "\n".join(lines))
     logger.info("Обновлены интересы %s: %s", author_name, interests_str)
+    if line is not None:
+        return content[:line.start()] + new_line + content[line.end():]
+    # Нет строки интересов — добавляем после заголовка автора
+    return content[:heading.end()] + "\n" + new_line + content[heading.end():]
+
+
+def family_memory_names(content: str) -> set[str]:
+    """Возвращает имена всех блоков ### Имя из FAMILY_MEMORY.md."""
+    return {block.split("\n", 1)[0].strip() for block in content.split("### ")[1:]}
+
 
+FRIENDS_HEADINGS = ("Friends and acquaintances", "Друзья и знакомые")
 
-async def update_family_memory(new_people: list[str]) -> None:
-    """Добавляет новых людей в FAMILY_MEMORY.md."""
-    if not new_people:
+
+async def update_family_memory(
+    new_people: list[str], interests: dict[str, list[str]] | None, files: SystemFileBuffer
+) -> None:
+    """Добавляет новых людей и интересы авторов в FAMILY_MEMORY.md одной записью."""
+    if not new_people and not interests:
         return
 
-    path = "_system/FAMILY_MEMORY.md"
-    content = await obsidian_get(path)
+    path = FAMILY_MEMORY_FILE
+    content = await files.get(path)
     if content is None:
         return
 
-    people_to_add = [p for p in new_people if p not in content]
-    if not people_to_add:
-        return
+    for author_name, author_interests in (interests or {}).items():
+        merged = merge_user_interests(content, author_name, author_interests)
+        if merged == content:
+            continue
+        content = merged
+        # Интересы правятся внутри блока автора — заменяем только его секцию
+        author = next(
+            (h for h in heading_sections(content) if h.rsplit("::", 1)[-1] == author_name),
+            None,
+        )
+        if author:
+            files.replace_section(path, author, content)
+        else:
+            files.set(path, content)
+
+    # Имена из заголовков ### — один проход вместо поиска подстроки на каждого человека
+    existing_names = family_memory_names(content)
+    people_to_add = [p for p in new_people if p not in existing_names]
+
+    if people_to_add:
+        new_entries = "\n".join(
+            f"### {person}\n- Упомянут(а) в заметках\n" for person in people_to_add
+        )
 
-    new_entries = "\n".join(
-        f"### {person}\n- Упомянут(а) в заметках\n" for person in people_to_add
-    )
+        # Ищем секцию друзей (может быть на русском или английском) и дописываем в её конец
+        friends = next(
+            (h for h in heading_sections(content) if h.rsplit("::", 1)[-1] in FRIENDS_HEADINGS),
+            None,
+        )
+        if friends:
+            files.append(path, "\n" + new_entries, heading=friends)
+        else:
+            files.extend(path, "\n\n## Друзья и знакомые\n\n" + new_entries + "\n")
+        logger.info("Новые люди в FAMILY_MEMORY: %s", people_to_add)
 
-    # Ищем секцию друзей (может быть на русском или английском)
-    friends_markers = ["## Friends and acquaintances", "## Друзья и знакомые"]
-    has_friends = any(m in content for m in friends_markers)
 
-    if has_friends:
-        content = content.rstrip() + "\n\n" + new_entries + "\n"
-    else:
-        content = content.rstrip() + "\n\n## Друзья и знакомые\n\n" + new_entries + "\n"
+# ─── Запись в Obsidian ───────────────────────────────────────────────────────
 
-    await obsidian_create(path, content)
-    logger.info("Новые люди в FAMILY_MEMORY: %s", people_to_add)
+# Блок frontmatter в начале файла: группа 1 — YAML между разделителями ---
+_FM_BLOCK_RE = re.compile(r"\A---[ \t]*\n(.*?)\n---[ \t]*(?:\n|\Z)", re.S)
+_YAML = fm.YAMLHandler()
 
 
-# ─── Запись в Obsidian ───────────────────────────────────────────────────────
+def fast_load_fm(content: str) -> dict:
+    """Метаданные frontmatter без сборки fm.Post — только для чтения.
+
+    Блок вырезается регуляркой и сразу отдаётся YAMLHandler (CSafeLoader,
+    если PyYAML собран с libyaml).
+    """
+    return split_fm(content)[0]
+
+
+def split_fm(content: str) -> tuple[dict, str]:
+    """(метаданные, тело без frontmatter) за одно совпадение регулярки."""
+    m = _FM_BLOCK_RE.match(content)
+    if m is None:
+        return {}, content
+    metadata = _YAML.load(m.group(1))
+    return (metadata if isinstance(metadata, dict) else {}), content[m.end():].strip()
+
 
 async def update_diary_authors(path: str, new_author: str) -> None:
-    """Обновляет authors и updated в frontmatter дневника."""
+    """Обновляет authors и updated в frontmatter дневника.
+
+    Разбирается и пересобирается только YAML-блок, тело дневника вставляется как есть.
+    """
     content = await obsidian_get(path)
     if not content:
         return
-    post = fm.loads(content)
-    authors = post.get("authors", [])
+    m = _FM_BLOCK_RE.match(content)
+    metadata = _YAML.load(m.group(1)) if m else None
+    if isinstance(metadata, dict):
+        body = content[m.end():]
+    else:
+        # Нет frontmatter или он не словарь (скаляр, список) — пусть его
+        # пересоберёт python-frontmatter
+        post = fm.loads(content)
+        metadata, body = post.metadata, None
+
+    authors = metadata.get("authors") or []
+    # authors: Имя вместо списка — превращаем в список
+    if not isinstance(authors, list):
+        authors = [authors]
     if new_author not in authors:
         authors.append(new_author)
-        post["authors"] = authors
+        metadata["authors"] = authors
     # Всегда обновляем timestamp при любом append
-    post["updated"] = datetime.now().strftime("%Y-%m-%d %H:%M")
-    await obsidian_create(path, fm.dumps(post))
+    metadata["updated"] = datetime.now().strftime("%Y-%m-%d %H:%M")
+
+    if body is None:
+        await obsidian_create(path, fm.dumps(post))
+    else:
+        await obsidian_create(path, f"---\n{_YAML.export(metadata)}\n---\n{body}")
 
 
 def _normalize_tag(tag: str) -> str:
@@ -468,6 +1139,7 @@ def _normalize_tag(tag: str) -> str:
     return tag.lstrip("#").strip()
 
 
+@lru_cache(maxsize=1024)
 def generate_person_tag(name: str) -> str:
     """Генерирует тег из имени человека.
 
@@ -475,7 +1147,8 @@ def generate_person_tag(name: str) -> str:
     'Пётр Иванович' → 'Пётр_Иванович'
     'Степан' → 'Степан'
     """
-    parts = name.strip().split()
+    # split() без аргументов сам отбрасывает пробелы по краям — strip() не нужен
+    parts = name.split()
     if len(parts) >= 3:
         # Имя Отчество Фамилия → И_О_Фамилия
         return f"{parts[0][0]}_{parts[1][0]}_{parts[2]}"
@@ -487,35 +1160,188 @@ def generate_person_tag(name: str) -> str:
     return ""
 
 
-def inject_tags_to_frontmatter(content: str, tags: list[str]) -> str:
-    """Гарантированно вставляет теги в frontmatter через python-frontmatter.
+def merge_tags(existing: list[str] | None, tags: list[str]) -> list[str]:
+    """Сливает теги frontmatter с новыми.
 
     Нормализует теги: убирает # (в YAML frontmatter Obsidian теги без #),
     дедуплицирует, отбрасывает пустые.
     """
-    if not tags:
-        return content
-    try:
-        post = fm.loads(content)
-        existing = post.get("tags", []) or []
-        # Нормализуем: убираем # из обоих списков, фильтруем None/пустые
-        all_tags = [_normalize_tag(t) for t in existing if t] + \
-                   [_normalize_tag(t) for t in tags if t]
-        # Дедупликация с сохранением порядка, отбрасываем пустые
-        merged = list(dict.fromkeys(t for t in all_tags if t))
-        post["tags"] = merged
-        return fm.dumps(post)
-    except Exception:
-        return content
+    # Нормализуем: убираем # из обоих списков, фильтруем None/пустые
+    all_tags = [_normalize_tag(t) for t in existing or [] if t] + \
+               [_normalize_tag(t) for t in tags if t]
+    # Дедупликация с сохранением порядка, отбрасываем пустые
+    return list(dict.fromkeys(t for t in all_tags if t))
+
+
+def _parse_note_meta(path: str, content: str, cache: VaultCache | None) -> tuple[list[str], list[str]]:
+    """Разбирает frontmatter: (нормализованные теги, related-пути) и кладёт их в cache."""
+    metadata = fast_load_fm(content)
+    tags = sorted({_normalize_tag(t) for t in metadata.get("tags", []) or [] if t})
+    related = [_from_wikilink(r) for r in metadata.get("related", []) or [] if r]
+    if cache:
+        cache.set_tags(path, content, tags, related)
+    return tags, related
+
+
+def note_tags(path: str, content: str, cache: VaultCache | None = None) -> set[str]:
+    """Теги заметки: из кеша по хешу содержимого, иначе из frontmatter."""
+    cached = cache.get_tags(path, content) if cache else None
+    if cached is None:
+        cached, _ = _parse_note_meta(path, content, cache)
+    return set(cached)
+
+
+def note_related(path: str, content: str, cache: VaultCache | None = None) -> list[str]:
+    """related заметки (пути без [[ ]]): из кеша по хешу содержимого, иначе из frontmatter."""
+    cached = cache.get_related(path, content) if cache else None
+    if cached is None:
+        _, cached = _parse_note_meta(path, content, cache)
+    return cached
+
+
+# Сколько заметок одновременно скачивается при поиске related: по HTTP/2 все
+# запросы — потоки одного соединения, 32 держат его загруженным
+RELATED_FETCH_CONCURRENCY = 32
+
+
+# Папки с заметками, среди которых ищутся related
+RELATED_FOLDERS = ("notes", "diary", "calendar", "tasks")
+
+# Где искать related для заметки данного intent'а: своя папка и notes.
+# Меньше кандидатов для скана; связи задач с дневником и т.п. по тегам не ищутся
+# (их по-прежнему может предложить LLM через CURRENT_CONTEXT)
+_INTENT_SCAN: dict[str, tuple[str, ...]] = {
+    "task": ("tasks", "notes"),
+    "diary": ("diary", "notes"),
+    "calendar": ("calendar", "notes"),
+    "note": RELATED_FOLDERS,
+}
+
+
+async def obsidian_search_tags(tags: set[str]) -> dict[str, list[str]] | None:
+    """Заметки, у которых в frontmatter.tags есть хотя бы один из tags: {путь: теги файла}.
+
+    Один POST /search/ (JsonLogic) — Obsidian отвечает из своего metadata cache,
+    без скачивания файлов. None — если плагин не поддерживает поиск.
+    """
+    wanted = sorted(tags | {f"#{t}" for t in tags})
+    query = {
+        "if": [
+            {"some": [{"var": "frontmatter.tags"}, {"in": [{"var": ""}, wanted]}]},
+            {"var": "frontmatter.tags"},
+            False,
+        ]
+    }
+    r = await obsidian_request(
+        "POST",
+        "/search/",
+        headers={"Content-Type": "application/vnd.olrapi.jsonlogic+json"},
+        content=orjson.dumps(query),
+        # Поиск ничего не меняет — 502/503 повторяем, как GET
+        idempotent=True,
+    )
+    if r.status_code in (400, 404, 405):
+        logger.debug("Поиск по тегам недоступен: %s", r.status_code)
+        return None
+    r.raise_for_status()
+    return {
+        item["filename"]: item.get("result") or []
+        for item in orjson.loads(r.content)
+        if isinstance(item.get("result"), list)
+    }
+
+
+async def _scan_vault_tags(
+    current_filename: str, cache: VaultCache | None, folders: tuple[str, ...] = RELATED_FOLDERS
+) -> dict[str, set[str]]:
+    """Теги всех заметок folders: листинг папок и чтение каждого файла."""
+    # Листинги всех папок с заметками — параллельно
+    listings = await asyncio.gather(*(obsidian_list_files(folder) for folder in folders))
+    for folder, files in zip(folders, listings):
+        logger.debug("Папка %s/: найдено %d файлов", folder, len(files))
+    # Не связываем с самим собой
+    paths = [p for files in listings for p in files if p != current_filename]
+
+    # Тела файлов — параллельно, не больше RELATED_FETCH_CONCURRENCY запросов сразу
+    contents = await gather_limited(
+        (obsidian_get(p) for p in paths), limit=RELATED_FETCH_CONCURRENCY
+    )
+
+    file_tags: dict[str, set[str]] = {}
+    for filepath, file_content in zip(paths, contents):
+        if not file_content or isinstance(file_content, BaseException):
+            continue
+        try:
+            file_tags[filepath] = note_tags(filepath, file_content, cache)
+        except Exception:
+            continue
+    return file_tags
+
+
+class TagIndex:
+    """Обратный индекс {тег: пути заметок} на одну пачку сессий.
+
+    Нужен, когда поиск Obsidian недоступен: vault сканируется один раз на пачку,
+    а не на каждую сессию. Записанные в пачке заметки добавляются через index_note().
+    """
+
+    def __init__(self) -> None:
+        self._by_tag: defaultdict[str, set[str]] = defaultdict(set)
+        self._by_path: dict[str, set[str]] = {}
+        self._lock = asyncio.Lock()
+        self._built = False
+        # Плагин без /search/ — больше не спрашиваем в этой пачке
+        self.search_unavailable = False
+
+    async def build(self, cache: VaultCache | None = None) -> None:
+        async with self._lock:
+            if self._built:
+                return
+            for path, ftags in (await _scan_vault_tags("", cache)).items():
+                # Заметки, записанные пока шёл скан, уже в индексе и свежее
+                if path not in self._by_path:
+                    self.index_note(path, ftags)
+            self._built = True
+
+    def index_note(self, path: str, tags: set[str] | list[str]) -> None:
+        for tag in self._by_path.pop(path, ()):
+            self._by_tag[tag].discard(path)
+        self._by_path[path] = set(tags)
+        for tag in self._by_path[path]:
+            self._by_tag[tag].add(path)
+
+    def related(
+        self,
+        tags: set[str],
+        current_filename: str,
+        folders: tuple[str, ...] = RELATED_FOLDERS,
+        limit: int = 5,
+    ) -> list[str]:
+        """До limit заметок из folders с наибольшим числом общих тегов."""
+        shared = Counter()
+        for tag in tags:
+            shared.update(p for p in self._by_tag.get(tag, ()) if p.split("/", 1)[0] in folders)
+        shared.pop(current_filename, None)
+        return [path for path, _ in shared.most_common(limit)]
 
 
 async def find_related_by_tags(
-    tags: list[str], current_filename: str, intent: str
+    tags: list[str],
+    current_filename: str,
+    intent: str,
+    cache: VaultCache | None = None,
+    index: TagIndex | None = None,
 ) -> list[str]:
     """Ищет заметки с совпадающими тегами в vault.
 
-    Сканирует папки notes/ и diary/, читает frontmatter каждого файла,
-    сравнивает теги. Возвращает до 5 наиболее связанных файлов.
+    Сначала — поиском Obsidian по frontmatter.tags (один запрос); если он недоступен —
+    по обратному индексу пачки index, а без него сканирует папки и читает frontmatter
+    каждого файла. Возвращает до 5 наиболее связанных файлов. Если передан cache —
+    frontmatter неизменённых файлов не парсится повторно.
+
+    Кандидаты берутся только из папок _INTENT_SCAN[intent] (своя папка + notes;
+    для note — все): скан в 2 раза меньше, но, например, задача не получит
+    related из дневника по одним лишь тегам.
     """
     if not tags:
         logger.debug("Нет тегов для поиска related")
@@ -523,35 +1349,41 @@ async def find_related_by_tags(
 
     # Нормализуем входные теги (убираем #) для корректного сравнения
     tags_set = set(_normalize_tag(t) for t in tags if t)
-    logger.debug("Ищем related для %s, теги: %s", current_filename, tags_set)
-    candidates: list[tuple[str, int]] = []  # (filename, кол-во совпавших тегов)
+    folders = _INTENT_SCAN.get(intent, _INTENT_SCAN["note"])
+    logger.debug("Ищем related для %s в %s, теги: %s", current_filename, folders, tags_set)
 
-    # Сканируем все папки с заметками
-    total_files = 0
-    for folder in ("notes", "diary", "calendar", "tasks"):
-        files = await obsidian_list_files(folder)
-        logger.debug("Папка %s/: найдено %d файлов", folder, len(files))
-        for filepath in files:
-            total_files += 1
-            # Не связываем с самим собой
-            if filepath == current_filename:
-                continue
-            file_content = await obsidian_get(filepath)
-            if not file_content:
-                continue
-            try:
-                post = fm.loads(file_content)
-                raw_tags = post.get("tags", []) or []
-                file_tags = set(_normalize_tag(t) for t in raw_tags if t)
-                overlap = len(tags_set & file_tags)
-                if overlap > 0:
-                    shared = tags_set & file_tags
-                    logger.debug("Related: %s совпадение %d (%s)", filepath, overlap, shared)
-                    candidates.append((filepath, overlap))
-            except Exception:
-                continue
+    found = None
+    if index is None or not index.search_unavailable:
+        try:
+            found = await obsidian_search_tags(tags_set)
+        except httpx.HTTPError as e:
+            logger.warning("Поиск по тегам не удался, сканируем vault: %s", e)
+        else:
+            if found is None and index is not None:
+                index.search_unavailable = True
+
+    if found is not None:
+        file_tags = {
+            path: {_normalize_tag(t) for t in raw if isinstance(t, str) and t}
+            for path, raw in found.items()
+            if path != current_filename and path.split("/", 1)[0] in folders
+        }
+    elif index is not None:
+        await index.build(cache)
+        related = index.related(tags_set, current_filename, folders)
+        logger.debug("Related по индексу пачки: %s", related)
+        return related
+    else:
+        file_tags = await _scan_vault_tags(current_filename, cache, folders)
+
+    candidates: list[tuple[str, int]] = []  # (filename, кол-во совпавших тегов)
+    for filepath, ftags in file_tags.items():
+        shared = tags_set & ftags
+        if shared:
+            logger.debug("Related: %s совпадение %d (%s)", filepath, len(shared), shared)
+            candidates.append((filepath, len(shared)))
 
-    logger.debug("Related итого: %d файлов, %d кандидатов", total_files, len(candidates))
+    logger.debug("Related итого: %d файлов, %d кандидатов", len(file_tags), len(candidates))
 
     # Сортируем по количеству совпавших тегов, берём top-5
     candidates.sort(key=lambda x: x[1], reverse=True)
@@ -573,62 +1405,107 @@ def _from_wikilink(link: str) -> str:
     return str(link)
 
 
-def inject_related_to_frontmatter(content: str, related: list[str]) -> str:
-    """Вставляет related в frontmatter как [[wiki-links]] для Obsidian графа."""
-    if not related:
-        return content
+def merge_related(existing: list[str] | None, related: list[str]) -> list[str]:
+    """Сливает related frontmatter с новыми как [[wiki-links]] для Obsidian графа."""
+    # Конвертируем всё в wiki-link формат
+    all_links = [_to_wikilink(r) for r in existing or [] if r] + \
+                [_to_wikilink(r) for r in related if r]
+    # Дедупликация по нормализованному пути
+    seen = set()
+    merged = []
+    for link in all_links:
+        key = _from_wikilink(link)
+        if key not in seen:
+            seen.add(key)
+            merged.append(link)
+    return merged
+
+
+def apply_metadata(
+    content: str,
+    *,
+    tags: list[str] | None = None,
+    created: datetime | None = None,
+    related: list[str] | None = None,
+) -> str:
+    """Все правки frontmatter заметки за один fm.loads/fm.dumps.
+
+    tags и related сливаются с существующими; created ставится, только если его ещё нет;
+    при related=[] поле related всё равно создаётся (для консистентности).
+    """
     try:
         post = fm.loads(content)
-        existing = post.get("related", []) or []
-        # Конвертируем всё в wiki-link формат
-        all_links = [_to_wikilink(r) for r in existing if r] + \
-                    [_to_wikilink(r) for r in related if r]
-        # Дедупликация по нормализованному пути
-        seen = set()
-        merged = []
-        for link in all_links:
-            key = _from_wikilink(link)
-            if key not in seen:
-                seen.add(key)
-                merged.append(link)
-        post["related"] = merged
-        return fm.dumps(post)
     except Exception:
-        return content
+        return content  # Если frontmatter не парсится — пропускаем
+    if tags:
+        post["tags"] = merge_tags(post.get("tags"), tags)
+    if created and "created" not in post.metadata:
+        post["created"] = created.strftime("%Y-%m-%d %H:%M")
+    if related is not None:
+        post["related"] = merge_related(post.get("related"), related)
+    return fm.dumps(post)
 
 
 async def validate_related_files(related: list[str]) -> list[str]:
     """Проверяет что файлы из related существуют в vault. Отбрасывает несуществующие."""
-    valid = []
-    for filepath in related:
-        if not filepath or not filepath.endswith(".md"):
-            continue
-        content = await obsidian_get(filepath)
-        if content is not None:
-            valid.append(filepath)
-    return valid
+    candidates = [f for f in related if f and f.endswith(".md")]
+    contents = await asyncio.gather(*(obsidian_get(f) for f in candidates))
+    return [f for f, content in zip(candidates, contents) if content is not None]
 
 
-async def add_backlinks(related_files: list[str], current_filename: str) -> None:
-    """Добавляет обратную ссылку (backlink) как [[wiki-link]] в related файлы."""
+async def add_backlinks(
+    related_files: list[str],
+    current_filename: str,
+    cache: VaultCache | None = None,
+    locks: defaultdict[str, asyncio.Lock] | None = None,
+) -> None:
+    """Добавляет обратную ссылку (backlink) как [[wiki-link]] в related файлы.
+
+    Сначала PATCH поля related, если плагин его не умеет — чтение, правка и PUT файла.
+    locks — lock'и заметок прогона: правка чужой заметки идёт под её lock.
+    """
     current_link = _to_wikilink(current_filename)
     current_normalized = _from_wikilink(current_link)
 
-    for filepath in related_files:
+    async def add_one(filepath: str) -> None:
+        if locks is None:
+            await _add_one(filepath)
+            return
+        # Параллельная сессия может в это же время дописывать заметку или её related
+        async with locks[filepath]:
+            await _add_one(filepath)
+
+    async def _add_one(filepath: str) -> None:
         file_content = await obsidian_get(filepath)
         if not file_content:
-            continue
-        try:
-            post = fm.loads(file_content)
-            existing = post.get("related", []) or []
-            # Проверяем оба формата: plain path и wiki-link
-            existing_normalized = {_from_wikilink(e) for e in existing}
-            if current_normalized not in existing_normalized:
-                existing.append(current_link)
-                post["related"] = existing
-                await obsidian_create(filepath, fm.dumps(post))
-        except Exception:
-            continue
+            return
+        # Ссылка уже есть (по кешу) — frontmatter не разбираем и файл не переписываем
+        if current_normalized in note_related(filepath, file_content, cache):
+            return
+        # Дописываем ссылку в related на стороне Obsidian — без выгрузки всего файла
+        if await obsidian_patch_frontmatter(filepath, "related", [current_link]):
+            return
+        # PUT перезапишет файл целиком — правим свежую копию, а не прочитанную до PATCH
+        file_content = await _fetch_file(filepath)
+        if not file_content:
+            return
+        post = fm.loads(file_content)
+        existing = post.get("related", []) or []
+        # Проверяем оба формата: plain path и wiki-link
+        existing_normalized = {_from_wikilink(e) for e in existing}
+        if current_normalized not in existing_normalized:
+            existing.append(current_link)
+            post["related"] = existing
+            updated = fm.dumps(post)
+            await obsidian_create(filepath, updated)
+            if cache:
+                _parse_note_meta(filepath, updated, cache)
+
+    # Файлы разные — обновляем параллельно; ошибка одного не мешает остальным
+    results = await gather_limited(add_one(f) for f in related_files)
+    for filepath, res in zip(related_files, results):
+        if isinstance(res, BaseException):
+            logger.debug("Backlink в %s не добавлен: %s", filepath, res)
 
 
 def fix_document_references(content: str, doc_filenames: list[str]) -> str:
@@ -640,87 +1517,192 @@ def fix_document_references(content: str, doc_filenames: list[str]) -> str:
     if not doc_filenames:
         return content
 
-    for fn in doc_filenames:
-        # Вариант с подчёркиваниями вместо пробелов (частая ошибка LLM)
-        mangled = fn.replace(" ", "_").replace(",", "").replace(",", "")
-        # Вариант без запятых
-        no_comma = fn.replace(",", "")
-
-        # Если LLM использовал искажённое имя — заменяем на правильное
-        if mangled != fn and mangled in content:
-            content = content.replace(mangled, fn)
-        if no_comma != fn and no_comma in content:
-            content = content.replace(no_comma, fn)
-
-        # Если ссылка на документ вообще отсутствует — добавляем в конец
-        if fn not in content:
-            content = content.rstrip() + f"\n\n![[attachments/documents/{fn}]]\n"
+    # Искажённые варианты имени → точное имя: пробелы на _ (частая ошибка LLM)
+    # и потерянные запятые. Все варианты заменяются одним проходом regex
+    variants = {
+        mangled: fn
+        for fn in doc_filenames
+        for mangled in {fn.replace(" ", "_").replace(",", ""), fn.replace(",", "")} - {fn}
+    }
+    if variants:
+        # Длинные варианты первыми — чтобы короткий не съел часть длинного
+        pattern = re.compile("|".join(map(re.escape, sorted(variants, key=len, reverse=True))))
+        content = pattern.sub(lambda m: variants[m.group(0)], content)
+
+    # Если ссылка на документ вообще отсутствует — добавляем в конец
+    missing = [fn for fn in doc_filenames if fn not in content]
+    if missing:
+        for fn in missing:
             logger.info("Добавлена ссылка на документ: %s", fn)
+        content = content.rstrip() + "".join(
+            f"\n\n![[attachments/documents/{fn}]]" for fn in missing
+        ) + "\n"
 
     return content
 
 
+# Строка-заголовок h1 целиком (вместе с переводом строки)
+_H1_RE = re.compile(r"^# [^\n]*\n?", re.M)
+
+
 def strip_frontmatter(content: str) -> str:
-    content = content.strip()
-    if content.startswith("---"):
-        parts = content.split("---", 2)
-        if len(parts) >= 3:
-            content = parts[2].strip()
+    """Убирает frontmatter и заголовки h1 — регулярками, без разбора YAML."""
+    content = content.lstrip()
+    # Тот же блок, что разбирают update_diary_authors и fast_load_fm: закрывающий
+    # разделитель — строка '---' целиком, а не любой '\n---' (например, '----')
+    m = _FM_BLOCK_RE.match(content)
+    if m is not None:
+        content = content[m.end():]
     # Убираем дублирующийся заголовок h1
-    lines = content.split("\n")
-    lines = [l for l in lines if not l.startswith("# ")]
-    return "\n".join(lines).strip()
+    return _H1_RE.sub("", content).strip()
 
 
 # ─── Основная функция ────────────────────────────────────────────────────────
 
+STATUS_COMMIT_EVERY = 16
+
+
 async def process_assembled_sessions(session: AsyncSession) -> int:
     """Берёт assembled сессии и записывает их в Obsidian.
     Возвращает количество обработанных сессий."""
 
+    # Сессии, оставшиеся в processing после упавшего прогона, возвращаем в очередь
+    # (пайплайн запускается одним процессом — чужих захваченных сессий быть не может)
+    await session.execute(
+        update(Session).where(Session.status == "processing").values(status="assembled")
+    )
+    # Атомарно забираем пачку: один UPDATE ... RETURNING вместо SELECT + записи по одной
     result = await session.execute(
-        select(Session).where(Session.status == "assembled")
+        update(Session)
+        .where(Session.status == "assembled")
+        .values(status="processing")
+        .returning(Session)
     )
     sessions = result.scalars().all()
+    await session.commit()
 
     if not sessions:
         return 0
 
-    # Загружаем базовый контекст один раз, intent-specific кешируем
-    base_context = await load_base_context()
+    # Загружаем базовый контекст один раз, intent-specific кешируем.
+    # Системные файлы держим в памяти — flush() буфера пишет их без повторных GET;
+    # изменения копим за весь прогон, подхватывая не записанные прошлым прогоном
+    system_files = await asyncio.to_thread(SystemFileBuffer.restore)
+    base_context = await load_base_context(system_files)
+    authors = build_author_index(base_context["family_memory"])
     intent_cache: dict[str, str] = {}
 
-    processed_count = 0
+    # Теги файлов vault между запусками — чтобы не парсить frontmatter неизменённых заметок
+    vault_cache = await asyncio.to_thread(VaultCache)
+    # Теги заметок для related, если поиск Obsidian недоступен — строится по требованию
+    tag_index = TagIndex()
+
+    # Фото и документы всей пачки — одним запросом вместо SELECT на каждую сессию.
+    # Нужны только имена файлов и file_id: описания vision, подписи и прочие текстовые
+    # колонки не читаются (raiseload — случайное обращение к ним бросит ошибку,
+    # а не пойдёт ленивой загрузкой, которая в AsyncSession всё равно невозможна)
+    media_rows = await session.execute(
+        select(Message).where(
+            Message.session_id.in_([s.id for s in sessions]),
+            or_(
+                (Message.message_type == "photo") & Message.photo_filename.isnot(None),
+                (Message.message_type == "document") & Message.document_filename.isnot(None),
+            ),
+        ).options(
+            load_only(
+                Message.session_id,
+                Message.message_type,
+                Message.raw_content,
+                Message.photo_filename,
+                Message.document_filename,
+                raiseload=True,
+            ),
+            *strict_loading(),
+        )
+    )
+    photos_by_session: defaultdict[int, list[Message]] = defaultdict(list)
+    docs_by_session: defaultdict[int, list[Message]] = defaultdict(list)
+    for media_msg in media_rows.scalars():
+        by_session = photos_by_session if media_msg.message_type == "photo" else docs_by_session
+        by_session[media_msg.session_id].append(media_msg)
+
+    # Сессии пишутся параллельно: AsyncSession не допускает конкурентных запросов,
+    # поэтому обращения к БД идут под db_lock; одна заметка — один writer (file_locks)
+    db_lock = asyncio.Lock()
+    file_locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+    sem = asyncio.Semaphore(max(1, settings.MAX_CONCURRENT_SESSIONS))
+
+    # Итоговые статусы пишем bulk UPDATE ... WHERE id IN (...) раз в STATUS_COMMIT_EVERY
+    # сессий и в конце пачки: при падении повторно обработается не больше этого числа
+    finished_ids: dict[str, list[int]] = {"processed": [], "error_obsidian": []}
+
+    async def _flush_statuses() -> None:
+        # Буфер системных файлов — на диск до коммита статусов: сессия, отмеченная
+        # processed, не теряет своих изменений памяти при падении прогона
+        await system_files.save()
+        async with db_lock:
+            for status, ids in finished_ids.items():
+                # Забираем id до await — параллельные сессии продолжают дописывать
+                batch, ids[:] = ids[:], []
+                if batch:
+                    await session.execute(
+                        update(Session).where(Session.id.in_(batch)).values(status=status)
+                    )
+            await session.commit()
+
+    async def _mark_done(session_id: int, status: str) -> None:
+        finished_ids[status].append(session_id)
+        if sum(map(len, finished_ids.values())) >= STATUS_COMMIT_EVERY:
+            await _flush_statuses()
+
+    intent_lock = asyncio.Lock()
 
-    for s in sessions:
+    async def _intent_config(intent: str) -> str:
+        # Сессии идут параллельно — под lock файл intent'а читается один раз
+        async with intent_lock:
+            if intent not in intent_cache:
+                intent_config = await load_system_file(f"intents/{intent}.md", system_files)
+                intent_cache[intent] = "" if "(file not found)" in intent_config else intent_config
+            return intent_cache[intent]
+
+    async def _locked(path: str, coro: Awaitable):
+        # Чтение-правка-запись заметки: другая сессия пачки может писать в неё же
+        async with file_locks[path]:
+            return await coro
+
+    async def _process_one(s: Session) -> bool:
         try:
             # Неизвестный intent → note
             intent = s.intent if s.intent != "unknown" else "note"
 
             # Загружаем intent-specific правила (с кешем)
-            if intent not in intent_cache:
-                intent_config = await load_system_file(f"intents/{intent}.md")
-                intent_cache[intent] = "" if "(file not found)" in intent_config else intent_config
-            context = {**base_context, "intent_config": intent_cache[intent]}
+            context = {**base_context, "intent_config": await _intent_config(intent)}
 
             logger.info("Записываем сессию %d (intent=%s)...", s.id, intent)
 
             # Определяем автора
-            author_name = resolve_author(s.author_id, context["family_memory"])
+            author_name = resolve_author(s.author_id, authors)
 
-            # Передаём в LLM (last_message_at — реальное время записи, не время открытия сессии)
-            llm_output = llm_process_session(
+            # Передаём в LLM (last_message_at — реальное время записи, не время открытия сессии).
+            # Клиент синхронный — выносим в поток, чтобы остальные сессии не стояли
+            llm_output = await asyncio.to_thread(
+                llm_process_session,
                 assembled_content=s.assembled_content,
                 intent=intent,
                 author_name=author_name,
                 created_at=s.last_message_at or s.opened_at,
                 context=context,
             )
+            doc_msgs = docs_by_session[s.id]
 
             # Парсим JSON ответ (новая схема: title вместо filename)
-            output_data = json.loads(extract_json(llm_output))
+            output_data = orjson.loads(extract_json(llm_output))
 
             title = output_data.get("title", "Без заголовка")
+
+            # Python генерирует имя файла
+            filename = generate_filename(title, intent, s.opened_at)
+
             content = output_data.get("content", "")
             tags = output_data.get("tags", [])
             people_mentioned = output_data.get("people_mentioned", [])
@@ -739,28 +1721,7 @@ async def process_assembled_sessions(session: AsyncSession) -> int:
                     if ptag:
                         tags.append(ptag)
 
-            # Python гарантирует теги в frontmatter
-            content = inject_tags_to_frontmatter(content, tags)
-
-            # Добавляем created timestamp в frontmatter (время из имени файла перенесли сюда)
-            try:
-                post = fm.loads(content)
-                created_ts = s.opened_at or datetime.now()
-                if "created" not in post.metadata:
-                    post["created"] = created_ts.strftime("%Y-%m-%d %H:%M")
-                content = fm.dumps(post)
-            except Exception:
-                pass  # Если frontmatter не парсится — пропускаем
-
-            # ── Собираем имена документов для post-processing ──
-            doc_messages_result = await session.execute(
-                select(Message).where(
-                    Message.session_id == s.id,
-                    Message.message_type == "document",
-                    Message.document_filename.isnot(None),
-                )
-            )
-            doc_msgs = doc_messages_result.scalars().all()
+            # ── Имена документов для post-processing ──
             doc_filenames = [m.document_filename for m in doc_msgs if m.document_filename]
 
             # Исправляем ссылки на документы (LLM может исказить имена файлов)
@@ -770,37 +1731,20 @@ async def process_assembled_sessions(session: AsyncSession) -> int:
             # Исправляем формат embed-ссылок (![alt]([[path]]) → ![[path]])
             content = fix_obsidian_embeds(content)
 
-            # Python генерирует имя файла
-            filename = generate_filename(title, intent, s.opened_at)
-
-            # Определяем action: create или append
-            existing = await obsidian_get(filename)
-
-            if existing is None:
-                await obsidian_create(filename, content)
-                logger.info("Создан файл: %s", filename)
-            else:
-                clean_content = strip_frontmatter(content)
-                await obsidian_append(filename, clean_content)
-                # Сливаем новые теги в существующий frontmatter
-                if tags:
-                    fresh = await obsidian_get(filename)
-                    if fresh:
-                        updated_content = inject_tags_to_frontmatter(fresh, tags)
-                        await obsidian_create(filename, updated_content)
-                logger.info("Дополнен файл: %s", filename)
-
-            # Обновляем authors для дневника
-            if intent == "diary":
-                await update_diary_authors(filename, author_name)
+            # Имя заметки известно — читаем её параллельно с поиском related
+            prefetch = asyncio.create_task(obsidian_get(filename))
 
             # ── Ищем related: LLM-предложения + совпадение по тегам ──
+            # (до записи заметки — чтобы frontmatter целиком ушёл одним PUT)
+            all_related: list[str] = []
             try:
                 # LLM может вернуть related из CURRENT_CONTEXT
                 llm_related = output_data.get("related", [])
 
                 # Поиск по совпадению тегов в vault
-                tag_related = await find_related_by_tags(tags, filename, intent)
+                tag_related = await find_related_by_tags(
+                    tags, filename, intent, vault_cache, tag_index
+                )
 
                 # Объединяем оба источника, дедупликация, max 5
                 all_related = list(dict.fromkeys(llm_related + tag_related))[:5]
@@ -808,105 +1752,152 @@ async def process_assembled_sessions(session: AsyncSession) -> int:
                 # Валидируем: оставляем только существующие файлы
                 if all_related:
                     all_related = await validate_related_files(all_related)
-
-                # Всегда обновляем related в frontmatter (даже если пустой — для консистентности)
-                fresh = await obsidian_get(filename)
-                if fresh:
-                    updated = inject_related_to_frontmatter(fresh, all_related) if all_related else fresh
-                    # Гарантируем наличие поля related (даже пустого)
-                    try:
-                        post = fm.loads(updated)
-                        if "related" not in post.metadata:
-                            post["related"] = []
-                        updated = fm.dumps(post)
-                    except Exception:
-                        pass
-                    await obsidian_create(filename, updated)
-
-                if all_related:
-                    # Добавляем backlink в найденные файлы
-                    await add_backlinks(all_related, filename)
-                    logger.info("Связано с: %s", all_related)
-                else:
-                    logger.debug("Related: не найдено совпадений")
             except Exception as e:
                 logger.warning("Ошибка поиска related: %s", e)
+            # Ошибку чтения покажет повторное чтение под lock
+            await asyncio.gather(prefetch, return_exceptions=True)
+
+            # Python гарантирует теги, created и related в frontmatter — один разбор YAML,
+            # одна запись файла (created — время из имени файла перенесли сюда).
+            # Lock заметки держим только на её чтение и запись
+            async with file_locks[filename]:
+                # Определяем action: create или append. Чтение через кеш отдаёт
+                # результат prefetch, если заметку не переписала другая сессия
+                # (запись сбрасывает кеш — тогда файл читается заново)
+                existing = await obsidian_get(filename)
+                if existing is None:
+                    note = apply_metadata(
+                        content,
+                        tags=tags,
+                        created=s.opened_at or datetime.now(),
+                        related=all_related,
+                    )
+                    await obsidian_create(filename, note)
+                    logger.info("Создан файл: %s", filename)
+                else:
+                    # Дописываем тело и сливаем новые теги в существующий frontmatter
+                    note = apply_metadata(
+                        existing + "\n" + strip_frontmatter(content),
+                        tags=tags,
+                        related=all_related,
+                    )
+                    await obsidian_create(filename, note)
+                    logger.info("Дополнен файл: %s", filename)
+            # Заметка только что записана — сразу кладём её теги в кеш и индекс пачки
+            try:
+                note_tag_list, _ = _parse_note_meta(filename, note, vault_cache)
+                tag_index.index_note(filename, note_tag_list)
+            except Exception:
+                pass
 
-            # Загружаем фото в vault
-            photo_messages = await session.execute(
-                select(Message).where(
-                    Message.session_id == s.id,
-                    Message.message_type == "photo",
-                    Message.photo_filename.isnot(None),
+            # Вложения и authors дневника не зависят друг от друга — параллельно
+            side_tasks: list[tuple[str, object]] = []
+            if intent == "diary":
+                side_tasks.append(
+                    (f"authors {filename}", _locked(filename, update_diary_authors(filename, author_name)))
                 )
-            )
-            for photo_msg in photo_messages.scalars().all():
+
+            for photo_msg in photos_by_session[s.id]:
                 photo_path = Path("media/images") / f"{photo_msg.raw_content}.jpeg"
-                if photo_path.exists():
-                    await obsidian_upload_image(photo_path, photo_msg.photo_filename)
+                if await asyncio.to_thread(photo_path.exists):
+                    upload = obsidian_upload_image(photo_path, photo_msg.photo_filename, vault_cache)
+                    side_tasks.append((f"фото {photo_path}", upload))
                 else:
                     logger.warning("Фото не найдено: %s", photo_path)
 
-            # Загружаем документы в vault
             for doc_msg in doc_msgs:
                 ext = Path(doc_msg.document_filename).suffix.lstrip(".") or "bin"
                 doc_path = Path("media/documents") / f"{doc_msg.raw_content}.{ext}"
-                if doc_path.exists():
-                    await obsidian_upload_document(doc_path, doc_msg.document_filename)
+                if await asyncio.to_thread(doc_path.exists):
+                    upload = obsidian_upload_document(doc_path, doc_msg.document_filename, vault_cache)
+                    side_tasks.append((f"документ {doc_path}", upload))
                 else:
                     logger.warning("Документ не найден: %s", doc_path)
 
-            # ── Обновляем системные файлы (память) ──
-            await update_current_context(context_summary, filename=filename, tags=tags)
-            await update_tags_glossary(tags)
-            await update_family_memory(new_people)
+            results = await gather_limited([coro for _, coro in side_tasks])
+            for (label, _), res in zip(side_tasks, results):
+                if isinstance(res, BaseException):
+                    logger.error("Ошибка записи (%s): %s", label, res)
 
-            # Обновляем интересы пользователя
-            user_interests = output_data.get("user_interests", [])
-            if user_interests:
-                await update_user_interests(author_name, user_interests)
+            if all_related:
+                # Добавляем backlink в найденные файлы
+                try:
+                    await add_backlinks(all_related, filename, vault_cache, file_locks)
+                    logger.info("Связано с: %s", all_related)
+                except Exception as e:
+                    logger.warning("Ошибка записи backlinks: %s", e)
+            else:
+                logger.debug("Related: не найдено совпадений")
 
-            # Обновляем статус сессии
-            s.status = "processed"
-            await session.commit()
+            # ── Копим изменения системных файлов (память) ──
+            system_files.add_context(context_summary, filename=filename, tags=tags)
+            system_files.add_tags(tags)
+            system_files.add_people(new_people)
+            system_files.add_interests(author_name, output_data.get("user_interests", []))
 
-            processed_count += 1
+            # Обновляем статус сессии (запись — пачкой, см. _mark_done)
+            await _mark_done(s.id, "processed")
+            return True
 
         except Exception as e:
             logger.error("Ошибка сессии %d: %s", s.id, e)
-            s.status = "error_obsidian"
-            await session.commit()
+            await _mark_done(s.id, "error_obsidian")
+            return False
+
+    async def _bounded(s: Session) -> bool:
+        async with sem:
+            return await _process_one(s)
+
+    try:
+        results = await asyncio.gather(*(_bounded(s) for s in sessions), return_exceptions=True)
+        processed_count = sum(1 for r in results if r is True)
+        await _flush_statuses()
+    finally:
+        # Накопленное за прогон пишем и при сбое — одной транзакцией, вне event loop
+        await asyncio.to_thread(vault_cache.close)
+
+    try:
+        await system_files.flush()
+    except Exception as e:
+        logger.error("Ошибка записи системных файлов: %s (сохранено в %s)", e, PENDING_SYSTEM_UPDATES)
 
     return processed_count
 
 
+# ![alt]([[path]]) и ![alt](attachments/...) — группа 2: путь
+_EMBED_BRACKET_RE = re.compile(r'!\[([^\]]*)\]\(\[\[([^\]]+)\]\]\)')
+_EMBED_ATTACH_RE = re.compile(r'!\[([^\]]*)\]\((attachments/[^)]+)\)')
+
+
 def fix_obsidian_embeds(content: str) -> str:
     """Исправляет формат embed-ссылок: LLM часто генерирует неправильный формат.
 
     ![alt]([[path]]) → ![[path]]
     ![alt](attachments/...) → ![[attachments/...]]
     """
-    import re
     # ![alt]([[path]]) → ![[path]]
-    content = re.sub(r'!\[([^\]]*)\]\(\[\[([^\]]+)\]\]\)', r'![[\2]]', content)
+    content = _EMBED_BRACKET_RE.sub(r'![[\2]]', content)
     # ![alt](attachments/...) → ![[attachments/...]]
-    content = re.sub(r'!\[([^\]]*)\]\((attachments/[^)]+)\)', r'![[\2]]', content)
+    content = _EMBED_ATTACH_RE.sub(r'![[\2]]', content)
     return content
 
 
+# Открывающий ```/```json в начале ответа и закрывающий ``` в конце
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```\s*$")
+_THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+
 def extract_json(raw: str) -> str:
     """Извлекает JSON из ответа reasoning модели (qwen3.5, deepseek и пр.)."""
-    import re
     # Убираем служебный префикс reasoning моделей
     if "<|message|>" in raw:
-        raw = raw.split("<|message|>")[-1]
+        raw = raw.rpartition("<|message|>")[2]
     # Убираем <think>...</think> блоки (qwen3.5 reasoning chain)
-    raw = re.sub(r"<think>.*?</think>", "", raw, flags=re.DOTALL)
+    raw = _THINK_RE.sub("", raw)
     # Если <think> без закрывающего тега — отрезаем всё до первого {
     if "<think>" in raw:
         idx = raw.find("{")
         if idx >= 0:
             raw = raw[idx:]
-    # Убираем markdown code fences если есть
-    raw = raw.strip().strip("```json").strip("```").strip()
-    return raw
\ No newline at end of file
+    # Убираем markdown code fences если есть (strip("```json") срезал бы и буквы j/s/o/n)
+    return _FENCE_RE.sub("", raw.strip()).strip()
\ No newline at end of file
@@ -1,8 +1,12 @@
+import asyncio
+import contextlib
 import logging
-import subprocess
+import os
 from pathlib import Path
 
+import numpy as np
 import onnx_asr
+import onnxruntime as ort
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -10,6 +14,13 @@ from ..storage.telegram_files import download_file
 from src.config import settings
 from ..storage.models import Message
 
+# PyAV (libav в процессе) — необязательная зависимость: без неё голосовые
+# декодируются внешним ffmpeg
+try:
+    import av
+except ImportError:
+    av = None
+
 logger = logging.getLogger(__name__)
 
 # Папка для временных файлов — удаляем после обработки
@@ -19,54 +30,145 @@ MEDIA_DIR = Path("media/voice")
 # Это важно — загрузка занимает несколько секунд
 _model = None
 
+# Провайдеры ONNX Runtime в порядке предпочтения: NVIDIA GPU, CoreML (Mac), CPU.
+# Берутся только те, что есть в установленной сборке onnxruntime
+PREFERRED_PROVIDERS = ("CUDAExecutionProvider", "CoreMLExecutionProvider", "CPUExecutionProvider")
+
+SAMPLE_RATE = 16000
+
+
+def get_providers() -> list[str]:
+    """Доступные провайдеры из PREFERRED_PROVIDERS; CPU — всегда последний."""
+    available = set(ort.get_available_providers())
+    return [p for p in PREFERRED_PROVIDERS if p in available] or ["CPUExecutionProvider"]
+
+
+def get_session_options() -> ort.SessionOptions:
+    """Все оптимизации графа, последовательное выполнение узлов, потоки — из настроек."""
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    # 0 — половина ядер: остальное остаётся event loop'у, ffmpeg и LLM-клиенту
+    so.intra_op_num_threads = settings.STT_INTRA_THREADS or max(1, (os.cpu_count() or 2) // 2)
+    return so
+
+
+# Суффикс файлов, которые квантует сам FamilyLog (STT_QUANT="int8-qop").
+# onnx_asr ищет файлы по маске <имя>?<quantization>.onnx
+QOP_SUFFIX = "int8qop"
+
+
+def quantize_matmul_int8(model_dir: Path) -> None:
+    """Создаёт рядом с каждым FP32 .onnx модели <имя>.int8qop.onnx, где в int8 — только MatMul.
+
+    Динамическое квантование всех операторов на CPU часто медленнее FP32
+    (DequantizeLinear перед узлами, нет VNNI-ядер для многих операторов);
+    только MatMul с весами QInt8 — быстрее FP32 и в ~4 раза меньше весов.
+    QUInt8 не используется. Уже созданные файлы не пересоздаются.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    for src in sorted(model_dir.glob("*.onnx")):
+        # Точка в имени — уже квантованный вариант (.int8, .int8qop)
+        if "." in src.stem:
+            continue
+        dst = src.with_name(f"{src.stem}.{QOP_SUFFIX}.onnx")
+        if dst.exists():
+            continue
+        logger.info("Квантуем MatMul в int8: %s → %s", src.name, dst.name)
+        quantize_dynamic(
+            src,
+            dst,
+            weight_type=QuantType.QInt8,
+            op_types_to_quantize=["MatMul"],
+            per_channel=False,
+            reduce_range=False,
+        )
+
+
+def get_quantization() -> str | None:
+    """quantization для onnx_asr.load_model по settings.STT_QUANT (пусто — FP32)."""
+    if settings.STT_QUANT == "int8-qop":
+        quantize_matmul_int8(Path(settings.STT_MODEL_PATH))
+        return QOP_SUFFIX
+    return settings.STT_QUANT or None
+
 
 def get_model():
     """Ленивая загрузка модели — только при первом вызове."""
     global _model
     if _model is None:
+        providers = get_providers()
         _model = onnx_asr.load_model(
             settings.STT_MODEL_OFFLINE,
             settings.STT_MODEL_PATH,
-            # quantization="int8",        # раскомментировать для Parakeet
-            providers=["CPUExecutionProvider"],
-            # providers=["CoreMLExecutionProvider", "CPUExecutionProvider"],  # раскомментировать на Intel Mac / Windows / Linux для ускорения
-            # providers=["CUDAExecutionProvider", "CPUExecutionProvider"],    # раскомментировать при наличии NVIDIA GPU
+            quantization=get_quantization(),
+            providers=providers,
+            sess_options=get_session_options(),
         )
+        logger.info("STT модель загружена, провайдеры: %s", providers)
+        # Первый прогон на секунде тишины: ядра и память арены готовятся здесь,
+        # а не на первом голосовом
+        _model.recognize(np.zeros(SAMPLE_RATE, dtype=np.float32), sample_rate=SAMPLE_RATE)
     return _model
 
-def convert_to_wav(ogg_path: Path) -> Path:
-    """Конвертирует .ogg в .wav через ffmpeg.
-    Parakeet требует: 16kHz, моно, PCM."""
-    wav_path = ogg_path.with_suffix(".wav")
-
-    result = subprocess.run(
-        [
-            "ffmpeg", "-y",          # -y перезаписать если существует
-            "-i", str(ogg_path),
-            "-ar", "16000",          # частота дискретизации 16kHz
-            "-ac", "1",              # моно канал
-            str(wav_path)
-        ],
-        capture_output=True,         # не выводить в терминал
+async def warmup() -> None:
+    """Загружает и прогревает модель в потоке, не блокируя event loop.
+
+    Процесс держит модель в _model, так что повторные вызовы ничего не стоят.
+    """
+    await asyncio.to_thread(get_model)
+
+
+def decode_pcm_av(ogg_path: Path) -> np.ndarray:
+    """Декодирует .ogg через PyAV прямо в процессе — без запуска ffmpeg на каждое голосовое.
+    Ресемплер libav сразу отдаёт 16kHz, моно, float32."""
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+    chunks = []
+    with av.open(str(ogg_path)) as container:
+        for frame in container.decode(audio=0):
+            chunks.extend(r.to_ndarray().ravel() for r in resampler.resample(frame))
+    # Остаток, накопленный внутри ресемплера
+    chunks.extend(r.to_ndarray().ravel() for r in resampler.resample(None))
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+
+
+async def decode_pcm(ogg_path: Path) -> np.ndarray:
+    """Декодирует .ogg в PCM прямо в память — без временного .wav.
+    Модели нужно: 16kHz, моно, float32, как его ждёт onnx_asr.
+    С PyAV — в потоке внутри процесса; без него — внешний ffmpeg, запущенный
+    асинхронно, чтобы ни event loop, ни поток пула на ожидание не тратились."""
+    if av is not None:
+        return await asyncio.to_thread(decode_pcm_av, ogg_path)
+
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-v", "error",
+        "-i", str(ogg_path),
+        "-ar", str(SAMPLE_RATE),  # частота дискретизации 16kHz
+        "-ac", "1",               # моно канал
+        "-f", "f32le",            # сырой float32 little-endian
+        "-",                      # в stdout
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,  # не выводить в терминал
     )
+    stdout, stderr = await proc.communicate()
 
-    if result.returncode != 0:
-        raise RuntimeError(f"ffmpeg error: {result.stderr.decode()}")
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg error: {stderr.decode()}")
 
-    return wav_path
+    return np.frombuffer(stdout, dtype=np.float32)
 
 
-def transcribe(wav_path: Path) -> str:
-    """Запускает STT модель и возвращает текст."""
+def transcribe_batch(waveforms: list[np.ndarray]) -> list[str]:
+    """Распознаёт несколько голосовых одним прогоном энкодера.
+    onnx_asr дополняет записи до самой длинной и возвращает тексты в порядке входа."""
     model = get_model()
-    # recognize() — синхронный вызов, возвращает строку
-    return model.recognize(str(wav_path))
+    return model.recognize(waveforms, sample_rate=SAMPLE_RATE)
 
 
-def cleanup(ogg_path: Path, wav_path: Path) -> None:
-    """Удаляет временные файлы после обработки."""
+def cleanup(ogg_path: Path) -> None:
+    """Удаляет временный файл после обработки."""
     ogg_path.unlink(missing_ok=True)
-    wav_path.unlink(missing_ok=True)
 
 
 async def process_voice_messages(session: AsyncSession) -> int:
@@ -85,40 +187,121 @@ async def process_voice_messages(session: AsyncSession) -> int:
     if not messages:
         return 0
 
-    processed_count = 0
+    # Загрузка и прогрев модели (секунды) идут в потоке, пока скачивается первое голосовое
+    model_ready = asyncio.create_task(warmup())
 
-    for msg in messages:
+    # Скачивания — сетевые, их держим много; ffmpeg — процесс на ядро (одно оставляем
+    # event loop'у); модель одна — её держит единственный воркер, который забирает
+    # накопившиеся к этому моменту записи пачкой до STT_BATCH_SIZE
+    download_sem = asyncio.Semaphore(max(1, settings.MAX_CONCURRENT_MEDIA))
+    decode_sem = asyncio.Semaphore(max(1, (os.cpu_count() or 2) - 1))
+    stt_queue: asyncio.Queue[tuple[np.ndarray, asyncio.Future]] = asyncio.Queue()
+
+    def _fail(fut: asyncio.Future, error: Exception) -> None:
+        # Ожидавший _one мог быть отменён — его future уже завершён
+        if not fut.done():
+            fut.set_exception(error)
+
+    async def _transcribe(batch: list[tuple[np.ndarray, asyncio.Future]]) -> None:
+        try:
+            await model_ready
+        except Exception as e:
+            for _, fut in batch:
+                _fail(fut, e)
+            return
+        try:
+            texts = await asyncio.to_thread(transcribe_batch, [w for w, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                _fail(batch[0][1], e)
+                return
+            # Одна битая запись не должна валить соседей по пачке — повторяем поштучно
+            texts = []
+            for waveform, fut in batch:
+                try:
+                    texts.append((await asyncio.to_thread(transcribe_batch, [waveform]))[0])
+                except Exception as single_error:
+                    _fail(fut, single_error)
+                    texts.append(None)
+        for (_, fut), text in zip(batch, texts):
+            if not fut.done():
+                fut.set_result(text)
+
+    async def _stt_worker() -> None:
+        while True:
+            batch = [await stt_queue.get()]
+            while len(batch) < max(1, settings.STT_BATCH_SIZE) and not stt_queue.empty():
+                batch.append(stt_queue.get_nowait())
+            try:
+                await _transcribe(batch)
+            finally:
+                # Воркер остановлен посреди пачки — ожидающие не должны висеть вечно
+                for _, fut in batch:
+                    fut.cancel()
+
+    stt_worker = asyncio.create_task(_stt_worker())
+    # AsyncSession не допускает параллельных запросов — коммиты под db_lock.
+    # Коммит — пачкой из MEDIA_COMMIT_BATCH сообщений, а не на каждое
+    db_lock = asyncio.Lock()
+    uncommitted = 0
+
+    async def _one(msg: Message) -> bool:
+        nonlocal uncommitted
         ogg_path = None
-        wav_path = None
+        # Поля сообщения меняем только под db_lock: правка ORM-объекта во время
+        # чужого commit (flush) теряется
+        text, status = None, "error_stt"
 
         try:
             logger.info("Обрабатываем аудио сообщение %d...", msg.id)
 
             # Скачиваем файл
-            ogg_path = await download_file(msg.raw_content, MEDIA_DIR, "ogg")
+            async with download_sem:
+                ogg_path = await download_file(msg.raw_content, MEDIA_DIR, "ogg")
 
-            # Конвертируем
-            wav_path = convert_to_wav(ogg_path)
+            # Декодируем в PCM
+            async with decode_sem:
+                waveform = await decode_pcm(ogg_path)
 
-            # Транскрибируем
-            text = transcribe(wav_path)
+            # Транскрибируем — в очереди воркера, вместе с другими готовыми записями
+            fut = asyncio.get_running_loop().create_future()
+            stt_queue.put_nowait((waveform, fut))
+            text = await fut
             logger.info("Транскрипция: %s...", text[:50])
 
-            # Обновляем запись в БД
-            msg.text_content = text
-            msg.status = "transcribed"
-            await session.commit()
-
-            processed_count += 1
+            status = "transcribed"
 
         except Exception as e:
             logger.error("Ошибка STT: %s", e)
-            msg.status = "error_stt"
-            await session.commit()
 
         finally:
-            # Удаляем временные файлы в любом случае
+            # Удаляем временный файл в любом случае
             if ogg_path:
-                cleanup(ogg_path, wav_path or ogg_path.with_suffix(".wav"))
+                cleanup(ogg_path)
+
+        # Обновляем запись в БД
+        async with db_lock:
+            if text is not None:
+                msg.text_content = text
+            msg.status = status
+            uncommitted += 1
+            if uncommitted >= settings.MEDIA_COMMIT_BATCH:
+                await session.commit()
+                uncommitted = 0
+        return status == "transcribed"
+
+    try:
+        results = await asyncio.gather(*(_one(msg) for msg in messages))
+    finally:
+        # Воркер гасим и при ошибке gather; записи, оставшиеся в очереди, отменяем
+        stt_worker.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await stt_worker
+        while not stt_queue.empty():
+            stt_queue.get_nowait()[1].cancel()
+    if uncommitted:
+        await session.commit()
 
-    return processed_count
\ No newline at end of file
+    # Если до транскрибации не дошло — дожидаемся потока загрузки и гасим его ошибку
+    await asyncio.gather(model_ready, return_exceptions=True)
+    return sum(results)
@@ -5,13 +5,13 @@
 сохраняет результат в vault/summaries/.
 """
 
-import json
+import asyncio
 import logging
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-import frontmatter as fm
+import orjson
 
 from ..LLMs_calls.calls import llm_generate_summary
 from .obsidian_writer import (
@@ -19,10 +19,14 @@ from .obsidian_writer import (
     obsidian_create,
     obsidian_list_files,
     extract_json,
+    split_fm,
+    gather_limited,
 )
 
 SUMMARY_MARKER_PATH = "_system/LAST_SUMMARY.md"
 SUMMARY_FOLDERS = ("notes", "diary", "calendar", "tasks")
+# Сколько файлов vault одновременно скачивается при сборе summary
+SUMMARY_FETCH_CONCURRENCY = 16
 
 
 async def get_last_summary_time() -> datetime | None:
@@ -49,57 +53,66 @@ async def save_last_summary_time(dt: datetime) -> None:
 async def collect_vault_content(since: datetime | None) -> dict[str, list[dict]]:
     """Собирает файлы из vault, созданные/обновлённые после since.
 
-    Возвращает: {"notes": [{"path": ..., "title": ..., "content": ...}], ...}
+    Возвращает: {"notes": [{"path": ..., "title": ..., "content": ..., "body": ...}], ...}
+    body — содержимое без frontmatter, его и отдаём в LLM.
     """
     result: dict[str, list[dict]] = {}
 
-    for folder in SUMMARY_FOLDERS:
-        files = await obsidian_list_files(folder)
-        entries = []
+    # Листинги папок — параллельно, затем все файлы одним пулом запросов
+    listings = await asyncio.gather(*(obsidian_list_files(folder) for folder in SUMMARY_FOLDERS))
+    paths = [
+        (folder, filepath)
+        for folder, files in zip(SUMMARY_FOLDERS, listings)
+        for filepath in files
+    ]
+    raws = await gather_limited(
+        (obsidian_get(filepath) for _, filepath in paths), limit=SUMMARY_FETCH_CONCURRENCY
+    )
+
+    for (folder, filepath), raw in zip(paths, raws):
+        # Сбой чтения, как и раньше, прерывает сбор — summary не строится по части vault
+        if isinstance(raw, BaseException):
+            raise raw
+        if not raw:
+            continue
+
+        # Проверяем дату через frontmatter (только YAML-блок, без сборки fm.Post)
+        body = raw
+        try:
+            meta, body = split_fm(raw)
+            created_str = meta.get("created", "")
+            updated_str = meta.get("updated", "")
+
+            # Берём самую свежую дату
+            file_date = None
+            for ds in (updated_str, created_str):
+                if ds:
+                    try:
+                        file_date = datetime.strptime(str(ds), "%Y-%m-%d %H:%M")
+                        break
+                    except ValueError:
+                        try:
+                            file_date = datetime.strptime(str(ds), "%Y-%m-%d")
+                        except ValueError:
+                            continue
 
-        for filepath in files:
-            raw = await obsidian_get(filepath)
-            if not raw:
+            # Если since задан — фильтруем по дате
+            if since and file_date and file_date < since:
                 continue
 
-            # Проверяем дату через frontmatter
-            try:
-                post = fm.loads(raw)
-                created_str = post.get("created", "")
-                updated_str = post.get("updated", "")
-
-                # Берём самую свежую дату
-                file_date = None
-                for ds in (updated_str, created_str):
-                    if ds:
-                        try:
-                            file_date = datetime.strptime(str(ds), "%Y-%m-%d %H:%M")
-                            break
-                        except ValueError:
-                            try:
-                                file_date = datetime.strptime(str(ds), "%Y-%m-%d")
-                            except ValueError:
-                                continue
-
-                # Если since задан — фильтруем по дате
-                if since and file_date and file_date < since:
-                    continue
-
-                title = post.get("title", "") or filepath
-                tags = post.get("tags", []) or []
-            except Exception:
-                title = filepath
-                tags = []
-
-            entries.append({
-                "path": filepath,
-                "title": str(title),
-                "tags": tags,
-                "content": raw,
-            })
-
-        if entries:
-            result[folder] = entries
+            title = meta.get("title", "") or filepath
+            tags = meta.get("tags", []) or []
+        except Exception:
+            title = filepath
+            tags = []
+
+        result.setdefault(folder, []).append({
+            "path": filepath,
+            "title": str(title),
+            "tags": tags,
+            "content": raw,
+            "body": body,
+        })
 
     return result
 
@@ -124,11 +137,7 @@ def format_content_for_llm(vault_data: dict[str, list[dict]], since: datetime |
         for entry in entries:
             parts.append(f"### {entry['title']}")
             # Для summary достаточно содержания без frontmatter
-            content = entry["content"]
-            if content.startswith("---"):
-                split = content.split("---", 2)
-                if len(split) >= 3:
-                    content = split[2].strip()
+            content = entry["body"]
             # Ограничиваем длину одной записи
             if len(content) > 2000:
                 content = content[:2000] + "\n...(обрезано)"
@@ -166,7 +175,7 @@ async def generate_summary(since: datetime | None) -> dict:
 
     # Генерируем summary через LLM
     llm_output = llm_generate_summary(llm_input, since)
-    output_data = json.loads(extract_json(llm_output))
+    output_data = orjson.loads(extract_json(llm_output))
 
     summary_text = output_data.get("summary_text", "")
     summary_content = output_data.get("content", "")
@@ -1,16 +1,22 @@
+import asyncio
 import base64
+import io
 import logging
+from functools import lru_cache
 from pathlib import Path
+from PIL import Image, ImageOps
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from slugify import slugify
 from datetime import datetime
 
-from ..schema.llm import PhotoOutput
+from ..schema.llm import parse_photo
 
 from ..LLMs_calls.calls import llm_process_photo
+from .obsidian_writer import extract_json
 from ..storage.models import Message
 from ..storage.telegram_files import download_file
+from src.config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -18,12 +24,51 @@ logger = logging.getLogger(__name__)
 MEDIA_DIR = Path("media/images")
 
 
-def image_to_base64(filepath: Path) -> str:
-    with open(filepath, 'rb') as f:
-        base64_bytes = base64.b64encode(f.read())
-        base64_string = base64_bytes.decode('ascii')
-        return base64_string
-    
+# Vision модель всё равно уменьшает картинку у себя — отправляем не больше VISION_MAX_SIDE
+# по длинной стороне: меньше base64, трафика и времени в энкодере изображений
+VISION_MAX_SIDE = 1024
+VISION_JPEG_QUALITY = 85
+
+
+def prepare_image(path: Path) -> bytes:
+    """JPEG для vision модели: уменьшенная копия, если фото больше VISION_MAX_SIDE.
+
+    Сам файл не меняется — в Obsidian уходит оригинал. Если Pillow не разобрал
+    файл, модели отправляется он как есть.
+    """
+    try:
+        img = Image.open(path)
+    except OSError as e:
+        logger.warning("Не удалось открыть %s для уменьшения: %s", path.name, e)
+        return path.read_bytes()
+    with img:
+        if max(img.size) <= VISION_MAX_SIDE:
+            return path.read_bytes()
+        # draft: libjpeg декодирует сразу в уменьшенном (1/2, 1/4, 1/8) масштабе
+        img.draft("RGB", (VISION_MAX_SIDE, VISION_MAX_SIDE))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((VISION_MAX_SIDE, VISION_MAX_SIDE), Image.LANCZOS)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+        return buf.getvalue()
+
+
+# Ключ — путь, mtime и размер: перезаписанный файл кодируется заново.
+# Уменьшенные фото — до сотни-другой КБ, 32 записи — единицы МБ в памяти
+@lru_cache(maxsize=32)
+def _data_url(path: str, mtime_ns: int, size: int) -> str:
+    # Префикс дописывается к bytes до единственного decode — готовый URL собирается
+    # один раз и кешируется, а не f-строкой поверх base64 на каждый запрос
+    return (b"data:image/jpeg;base64," + base64.b64encode(prepare_image(Path(path)))).decode("ascii")
+
+
+def image_to_data_url(filepath: Path) -> str:
+    """data:-URL изображения для vision модели; повторные вызовы для того же файла берутся из кеша."""
+    st = filepath.stat()
+    return _data_url(str(filepath), st.st_mtime_ns, st.st_size)
+
 
 def make_photo_filename(caption: str, created_at: datetime) -> str:
     date_str = created_at.strftime("%Y-%m-%d")
@@ -46,38 +91,57 @@ async def process_photo_messages(session: AsyncSession) -> int:
     if not messages:
         return 0
 
-    processed_count = 0
+    # Скачивание и запрос к vision модели — сетевые, обрабатываем несколько фото сразу
+    sem = asyncio.Semaphore(max(1, settings.MAX_CONCURRENT_MEDIA))
+    # AsyncSession не допускает параллельных запросов — коммиты под db_lock.
+    # Коммит — пачкой из MEDIA_COMMIT_BATCH сообщений, а не на каждое
+    db_lock = asyncio.Lock()
+    uncommitted = 0
 
-    for msg in messages:
-        photo_path = None
+    async def _one(msg: Message) -> bool:
+        nonlocal uncommitted
         photo_caption = msg.caption or None
+        # Поля сообщения меняем только под db_lock: правка ORM-объекта во время
+        # чужого commit (flush) теряется
+        updates = {"status": "error_img"}
 
         try:
-            logger.info("Обрабатываем фото сообщение %d...", msg.id)
+            async with sem:
+                logger.info("Обрабатываем фото сообщение %d...", msg.id)
 
-            # Скачиваем файл
-            photo_path = await download_file(msg.raw_content, MEDIA_DIR, "jpeg")
+                # Скачиваем файл
+                photo_path = await download_file(msg.raw_content, MEDIA_DIR, "jpeg")
 
-            # получаем описание
-            base64_str = image_to_base64(photo_path)
-            description = llm_process_photo(base64_str, photo_caption)
+                # получаем описание (декодирование, уменьшение и base64 — в потоке)
+                image_url = await asyncio.to_thread(image_to_data_url, photo_path)
+                description = await llm_process_photo(image_url, photo_caption)
 
             # Обновляем запись в БД
-            output = PhotoOutput.model_validate_json(description)
-            filename = make_photo_filename(output.caption, msg.created_at)
-            msg.photo_filename = filename
-            msg.original_caption = msg.caption # сохраняем до перезаписи
-            msg.caption = output.caption  # обновляем заголовок
-            msg.text_content = f"Заголовок: {output.caption}. Описание: {output.description}"
-            logger.info("Описание LLM: %s...", msg.text_content[:100])
-            msg.status = "described"
-            await session.commit()
-
-            processed_count += 1
+            # Тот же разбор ответа, что и для сессий: без <think> и ```json ограждений
+            output = parse_photo(extract_json(description))
+            text_content = f"Заголовок: {output.caption}. Описание: {output.description}"
+            updates = {
+                "photo_filename": make_photo_filename(output.caption, msg.created_at),
+                "original_caption": msg.caption,  # сохраняем до перезаписи
+                "caption": output.caption,  # обновляем заголовок
+                "text_content": text_content,
+                "status": "described",
+            }
+            logger.info("Описание LLM: %s...", text_content[:100])
 
         except Exception as e:
             logger.error("Ошибка vision: %s", e)
-            msg.status = "error_img"
-            await session.commit()
 
-    return processed_count
\ No newline at end of file
+        async with db_lock:
+            for field, value in updates.items():
+                setattr(msg, field, value)
+            uncommitted += 1
+            if uncommitted >= settings.MEDIA_COMMIT_BATCH:
+                await session.commit()
+                uncommitted = 0
+        return updates["status"] == "described"
+
+    results = await asyncio.gather(*(_one(msg) for msg in messages))
+    if uncommitted:
+        await session.commit()
+    return sum(results)
@@ -1,6 +1,16 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 
 
 class PhotoOutput(BaseModel):
     caption: str = Field(..., description='Заголовок обрабатываемого изображения')
-    description: str = Field(..., description='Описание обрабатываемого изображения')
\ No newline at end of file
+    description: str = Field(..., description='Описание обрабатываемого изображения')
+
+
+# Валидатор собирается один раз при импорте; validate_json адаптера чуть быстрее
+# PhotoOutput.model_validate_json — меньше обвязки на каждый вызов
+_PhotoAdapter = TypeAdapter(PhotoOutput)
+
+
+def parse_photo(raw: str | bytes) -> PhotoOutput:
+    """Разбирает JSON-ответ vision модели в PhotoOutput."""
+    return _PhotoAdapter.validate_json(raw)
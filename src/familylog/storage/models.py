@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import ForeignKey, String
+from sqlalchemy import ForeignKey, Index, String, false
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 # sqlite3 -header -csv familylog.db "SELECT * FROM messages;" > _local_CSV/messages.csv
@@ -12,12 +12,19 @@ class Base(DeclarativeBase):
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (
+        # close_all_open_sessions: status='open' AND last_message_at < cutoff;
+        # assembler/writer: выборки по одному status
+        Index("ix_sess_open", "status", "last_message_at"),
+        # get_open_session — на каждое входящее сообщение
+        Index("ix_sess_author_status", "author_id", "status"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     chat_id: Mapped[int] = mapped_column()
     author_id: Mapped[int] = mapped_column()
     intent: Mapped[str] = mapped_column(String(50))
-    status: Mapped[str] = mapped_column(String(20), default="open")
+    status: Mapped[str] = mapped_column(String(20), default="open", server_default="open")
     # open    — сессия активна, принимает сообщения
     # ready   — закрыта, ждёт обработки LLM
     # processed — записана в Obsidian
@@ -34,11 +41,21 @@ class Session(Base):
     # last_message_at обновляется при каждом новом сообщении
     # collector проверяет: если now() - last_message_at > 2ч → закрыть сессию
 
-    messages: Mapped[list["Message"]] = relationship(back_populates="session")
+    messages: Mapped[list["Message"]] = relationship(
+        back_populates="session", order_by="Message.created_at"
+    )
+    # Загружается явно: select(Session).options(selectinload(Session.messages)) —
+    # один IN-запрос на пачку сессий вместо запроса на каждую
 
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Сообщения сессий (selectinload, фото/документы в writer)
+        Index("ix_msg_session_status", "session_id", "status"),
+        # pending голосовые/фото/документы в процессорах
+        Index("ix_msg_type_status", "message_type", "status"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     telegram_message_id: Mapped[int] = mapped_column(unique=True)
@@ -69,7 +86,7 @@ class Message(Base):
 
     # блок для пересланных сообщений
     original_caption: Mapped[Optional[str]] = mapped_column()
-    is_forwarded: Mapped[bool] = mapped_column(default=False)
+    is_forwarded: Mapped[bool] = mapped_column(default=False, server_default=false())
     forward_from_name: Mapped[Optional[str]] = mapped_column(String(100))
     forward_from_username: Mapped[Optional[str]] = mapped_column(String(100))
     forward_post_url: Mapped[Optional[str]] = mapped_column(String(200))
@@ -79,7 +96,9 @@ class Message(Base):
     # для voice — результат STT
     # для photo — "Заголовок: X. Описание: Y" после vision обработки
 
-    status: Mapped[str] = mapped_column(String(50), default="pending")
+    # server_default — DEFAULT в схеме для новых БД; default остаётся для БД,
+    # созданных раньше (create_all не меняет существующие колонки)
+    status: Mapped[str] = mapped_column(String(50), default="pending", server_default="pending")
     # pending      — только что получено
     # transcribed  — voice расшифрован (text_content заполнен)
     # described    — photo описано (text_content заполнен)
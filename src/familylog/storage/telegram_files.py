@@ -1,31 +1,89 @@
+import asyncio
 from pathlib import Path
 
+import aiofiles
+import aiofiles.os
 import httpx
 
 from src.config import settings
 
+# Базовые URL Bot API — собираются один раз при импорте
+_API = f"https://api.telegram.org/bot{settings.BOT_TOKEN}"
+_FILE_API = f"https://api.telegram.org/file/bot{settings.BOT_TOKEN}"
+
+# Размер куска при записи скачиваемого файла на диск
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+
+# Сколько файлов одновременно качается с Telegram на весь процесс — независимо
+# от того, сколько обработчиков (голосовые, фото, документы) запрашивают файлы
+_download_sem = asyncio.Semaphore(max(1, settings.MAX_CONCURRENT_MEDIA))
+
+# Общий клиент Telegram на весь прогон: getFile и скачивание файлов идут
+# по уже открытым keep-alive соединениям вместо нового TLS-рукопожатия на каждый файл.
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Ленивая инициализация общего клиента Telegram — только при первом вызове."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=30,
+            http2=True,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Закрывает общий клиент Telegram (вызывать в конце прогона)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
 
 async def download_file(file_id: str, dest_dir: Path, extension: str) -> Path:
     """Скачивает файлы с Telegram по file_id.
     Возвращает путь к сохранённому файлу."""
     dest_dir.mkdir(parents=True, exist_ok=True)
+    file_path = dest_dir / f"{file_id}.{extension}"
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        # Шаг 1: получаем путь к файлу на серверах Telegram
-        r = await client.get(
-            f"https://api.telegram.org/bot{settings.BOT_TOKEN}/getFile",
-            params={"file_id": file_id}
-        )
-        r.raise_for_status()
-        telegram_path = r.json()["result"]["file_path"]
+    async with _download_sem:
+        return await _download(file_id, file_path)
 
-        # Шаг 2: скачиваем сам файл
-        r = await client.get(
-            f"https://api.telegram.org/file/bot{settings.BOT_TOKEN}/{telegram_path}"
-        )
-        r.raise_for_status()
-        print(r)
 
-    file_path = dest_dir / f"{file_id}.{extension}"
-    file_path.write_bytes(r.content)
-    return file_path
\ No newline at end of file
+async def _download(file_id: str, file_path: Path) -> Path:
+    """getFile и само скачивание — вызывается под _download_sem."""
+    client = get_client()
+    # Шаг 1: получаем путь к файлу на серверах Telegram
+    r = await client.get(f"{_API}/getFile", params={"file_id": file_id})
+    r.raise_for_status()
+    telegram_path = r.json()["result"]["file_path"]
+
+    # Шаг 2: скачиваем сам файл — потоком сразу на диск, не держа его целиком в памяти.
+    # Пишем во временный .part и переименовываем только после полного скачивания:
+    # оборванное соединение не оставляет обрезанный файл под итоговым именем
+    part_path = file_path.with_name(f"{file_path.name}.part")
+    try:
+        async with client.stream("GET", f"{_FILE_API}/{telegram_path}") as r:
+            r.raise_for_status()
+            async with aiofiles.open(part_path, "wb") as f:
+                async for chunk in r.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    await f.write(chunk)
+        await aiofiles.os.replace(part_path, file_path)
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+
+    return file_path
+
+
+async def download_files(files: list[tuple[str, Path, str]]) -> list[Path | BaseException]:
+    """Скачивает пачку файлов (file_id, dest_dir, extension) параллельно.
+    Результаты — в порядке входа; ошибка отдельного файла возвращается вместо пути."""
+    return await asyncio.gather(
+        *(download_file(file_id, dest_dir, ext) for file_id, dest_dir, ext in files),
+        return_exceptions=True,
+    )
+
@@ -0,0 +1,121 @@
+"""Локальный кеш метаданных заметок vault между запусками.
+
+Obsidian REST API не отдаёт mtime в листинге папки, поэтому файл опознаётся
+по хешу содержимого: если хеш совпал с сохранённым — frontmatter не парсится.
+Для вложений хранится хеш загруженного файла — повторно грузим только изменённые.
+"""
+import hashlib
+import json
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+CACHE_PATH = Path("media/vault_cache.db")
+
+
+FILE_HASH_CHUNK = 1024 * 1024
+
+
+def content_hash(content: str) -> str:
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def file_hash(path: Path) -> str:
+    """blake2b файла, читаемого кусками (вложения бывают в десятки мегабайт)."""
+    h = hashlib.blake2b(digest_size=16)
+    with path.open("rb") as f:
+        while chunk := f.read(FILE_HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class VaultCache:
+    """SQLite таблица files(path, hash, tags, related) — теги и related frontmatter по файлам vault,
+    и attachments(path, hash) — хеши загруженных вложений.
+
+    Таблицы читаются целиком при открытии, изменения пишутся в close() одной
+    транзакцией: в остальное время обращения идут в память, без SQLite в event loop.
+    """
+
+    def __init__(self, path: Path = CACHE_PATH) -> None:
+        self._path = path
+        self._dirty_files: set[str] = set()
+        self._dirty_attachments: set[str] = set()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            # path → (hash, tags JSON, related JSON)
+            self._files: dict[str, tuple[str, str, str]] = {
+                row[0]: row[1:]
+                for row in conn.execute("SELECT path, hash, tags, related FROM files")
+            }
+            self._attachments: dict[str, str] = dict(
+                conn.execute("SELECT path, hash FROM attachments")
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, hash TEXT NOT NULL, tags TEXT NOT NULL, "
+            "related TEXT NOT NULL DEFAULT '[]')"
+        )
+        # Кеш, созданный до появления колонки related
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(files)")}
+        if "related" not in columns:
+            conn.execute("ALTER TABLE files ADD COLUMN related TEXT NOT NULL DEFAULT '[]'")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS attachments (path TEXT PRIMARY KEY, hash TEXT NOT NULL)"
+        )
+        conn.commit()
+        return conn
+
+    def _row(self, path: str, content: str) -> tuple[str, str] | None:
+        row = self._files.get(path)
+        if row is None or row[0] != content_hash(content):
+            return None
+        return row[1], row[2]
+
+    def get_tags(self, path: str, content: str) -> list[str] | None:
+        """Теги из кеша или None, если файла нет в кеше или он изменился."""
+        row = self._row(path, content)
+        return json.loads(row[0]) if row else None
+
+    def get_related(self, path: str, content: str) -> list[str] | None:
+        """related (пути без [[ ]]) из кеша или None, если файла нет в кеше или он изменился."""
+        row = self._row(path, content)
+        return json.loads(row[1]) if row else None
+
+    def set_tags(
+        self, path: str, content: str, tags: list[str], related: list[str] | None = None
+    ) -> None:
+        self._files[path] = (
+            content_hash(content),
+            json.dumps(tags, ensure_ascii=False),
+            json.dumps(related or [], ensure_ascii=False),
+        )
+        self._dirty_files.add(path)
+
+    def get_attachment_hash(self, path: str) -> str | None:
+        """Хеш вложения, которое мы последним загрузили по этому пути vault."""
+        return self._attachments.get(path)
+
+    def set_attachment_hash(self, path: str, digest: str) -> None:
+        self._attachments[path] = digest
+        self._dirty_attachments.add(path)
+
+    def close(self) -> None:
+        """Записывает изменения за прогон одной транзакцией."""
+        if not (self._dirty_files or self._dirty_attachments):
+            return
+        with closing(self._connect()) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO files (path, hash, tags, related) VALUES (?, ?, ?, ?)",
+                [(p, *self._files[p]) for p in self._dirty_files],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO attachments (path, hash) VALUES (?, ?)",
+                [(p, self._attachments[p]) for p in self._dirty_attachments],
+            )
+            conn.commit()
+        self._dirty_files.clear()
+        self._dirty_attachments.clear()
@@ -1,6 +1,8 @@
 import sys
 from loguru import logger
 
+from src.config import settings
+
 logger.remove()
 
 logger.add(
@@ -15,5 +17,10 @@ logger.add(
     rotation="10:00",
     retention="30 days",
     compression="zip",
-    level="DEBUG"
-)
\ No newline at end of file
+    level="DEBUG",
+    # Запись и zip при ротации — в отдельном потоке, а не в event loop на вызове лога
+    enqueue=True,
+    # Развёрнутый traceback со значениями переменных — только в режиме разработки
+    backtrace=settings.DEBUG,
+    diagnose=settings.DEBUG,
+)
@@ -0,0 +1,119 @@
+import asyncio
+import os
+from urllib.parse import unquote
+
+import frontmatter as fm
+import httpx
+import orjson
+import pytest
+
+# Settings читаются при импорте модулей — обязательные поля задаём до импорта
+os.environ.setdefault("BOT_TOKEN", "test-token")
+os.environ.setdefault("OBSIDIAN_VAULT_PATH", "/tmp/vault")
+os.environ.setdefault("OBSIDIAN_API_KEY", "test-key")
+
+from src.familylog.processor import obsidian_writer as ow  # noqa: E402
+
+
+class FakeVault:
+    """Local REST API Obsidian в памяти: GET/PUT/POST/PATCH по /vault/{path}.
+
+    fail — очередь ответов (статус или исключение) на (метод, путь), выдаются до
+    обычной обработки. PATCH frontmatter и heading (append/replace секции) по умолчанию
+    не поддерживаются (400).
+    """
+
+    def __init__(self, files: dict[str, str] | None = None) -> None:
+        self.files: dict[str, str] = dict(files or {})
+        self.calls: list[tuple[str, str]] = []
+        self.fail: dict[tuple[str, str], list[int | Exception]] = {}
+        self.patch_frontmatter = False
+        self.patch_heading = False
+
+    def count(self, method: str, path: str) -> int:
+        return self.calls.count((method, path))
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        # Отдаём управление циклу — параллельные запросы перемешиваются, как в сети
+        await asyncio.sleep(0)
+        path = unquote(request.url.path)
+        self.calls.append((request.method, path))
+
+        queued = self.fail.get((request.method, path))
+        if queued:
+            outcome = queued.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return httpx.Response(outcome)
+
+        if not path.startswith("/vault/"):
+            return httpx.Response(404)
+        vault_path = path[len("/vault/"):]
+        body = (await request.aread()).decode("utf-8")
+
+        if request.method in ("GET", "HEAD"):
+            if vault_path.endswith("/"):
+                files = [p[len(vault_path):] for p in self.files if p.startswith(vault_path)]
+                return httpx.Response(200, json={"files": files})
+            if vault_path not in self.files:
+                return httpx.Response(404)
+            return httpx.Response(200, text=self.files[vault_path])
+        if request.method == "PUT":
+            self.files[vault_path] = body
+            return httpx.Response(204)
+        if request.method == "POST":
+            self.files[vault_path] = self.files.get(vault_path, "") + body
+            return httpx.Response(204)
+        if request.method == "PATCH":
+            target_type = request.headers["Target-Type"]
+            if target_type == "frontmatter" and self.patch_frontmatter:
+                post = fm.loads(self.files[vault_path])
+                key = unquote(request.headers["Target"])
+                post[key] = (post.get(key) or []) + orjson.loads(body)
+                self.files[vault_path] = fm.dumps(post)
+                return httpx.Response(200)
+            if target_type == "heading" and self.patch_heading:
+                content = self.files[vault_path]
+                span = ow.heading_spans(content).get(unquote(request.headers["Target"]))
+                if span is None:
+                    return httpx.Response(400)
+                start, end = span
+                if request.headers["Operation"] == "replace":
+                    self.files[vault_path] = content[:start] + body + content[end:]
+                else:
+                    self.files[vault_path] = content[:end] + body + content[end:]
+                return httpx.Response(200)
+            return httpx.Response(400)
+        return httpx.Response(405)
+
+
+FAMILY_MEMORY = (
+    "# Family\n\n## Семья\n### Степан\n- id: 1\n\n"
+    "## Друзья и знакомые\n\n### Вася\n- друг\n\n## Прочее\n- заметка\n"
+)
+
+
+@pytest.fixture
+def vault(monkeypatch):
+    """Подменяет клиент Obsidian на FakeVault; повторы — без пауз."""
+    fake = FakeVault()
+    monkeypatch.setattr(
+        ow, "_client", httpx.AsyncClient(base_url="http://obsidian", transport=httpx.MockTransport(fake.handler))
+    )
+    monkeypatch.setattr(ow, "_retry_delay", lambda attempt, r: 0)
+    ow._get_cache.clear()
+    ow._list_cache.clear()
+    yield fake
+    ow._get_cache.clear()
+    ow._list_cache.clear()
+
+
+@pytest.fixture
+def system_vault(vault):
+    """FakeVault с системными файлами _system/."""
+    vault.files.update({
+        ow.FAMILY_MEMORY_FILE: FAMILY_MEMORY,
+        ow.CURRENT_CONTEXT_FILE: "# Current Context\n",
+        ow.TAGS_GLOSSARY_FILE: "# Tags\n- #семья\n",
+    })
+    return vault
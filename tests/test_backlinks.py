@@ -0,0 +1,21 @@
+import asyncio
+
+import frontmatter as fm
+
+from src.familylog.processor import obsidian_writer as ow
+
+
+def test_backlink_fallback_rereads_note_changed_after_first_read(vault):
+    vault.files["notes/target.md"] = "---\ntags:\n- семья\n---\n\nтекст\n"
+
+    async def scenario():
+        # Кеш держит старую версию, а в vault заметку уже дописали
+        await ow.obsidian_get("notes/target.md")
+        vault.files["notes/target.md"] += "\nдописано\n"
+        await ow.add_backlinks(["notes/target.md"], "notes/a.md")
+
+    asyncio.run(scenario())
+
+    post = fm.loads(vault.files["notes/target.md"])
+    assert post["related"] == ["[[notes/a]]"]
+    assert "дописано" in post.content
@@ -0,0 +1,82 @@
+import asyncio
+import json
+from collections import defaultdict
+from datetime import datetime
+
+import frontmatter as fm
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.familylog.processor import obsidian_writer as ow
+from src.familylog.storage.models import Base, Session
+
+
+def test_concurrent_backlinks_to_same_note_are_not_lost(vault):
+    vault.files["notes/target.md"] = "---\ntags:\n- семья\n---\n\nтекст\n"
+    locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def scenario():
+        await asyncio.gather(
+            ow.add_backlinks(["notes/target.md"], "notes/a.md", locks=locks),
+            ow.add_backlinks(["notes/target.md"], "notes/b.md", locks=locks),
+        )
+
+    asyncio.run(scenario())
+
+    related = fm.loads(vault.files["notes/target.md"])["related"]
+    assert sorted(related) == ["[[notes/a]]", "[[notes/b]]"]
+
+
+def _llm_output(text: str) -> str:
+    return json.dumps({
+        "title": "Общая заметка",
+        "content": f"# Общая заметка\n\n{text}\n",
+        "tags": ["семья"],
+        "related": ["notes/old.md"],
+        "people_mentioned": [],
+        "new_people": [],
+        "context_summary": text,
+        "user_interests": [],
+    }, ensure_ascii=False)
+
+
+def test_sessions_writing_same_note_concurrently(system_vault, monkeypatch, tmp_path):
+    vault = system_vault
+    monkeypatch.chdir(tmp_path)
+    vault.files["notes/old.md"] = "---\ntags:\n- семья\n---\n\nстарое\n"
+    monkeypatch.setattr(
+        ow, "llm_process_session", lambda assembled_content, **kwargs: _llm_output(assembled_content)
+    )
+
+    async def scenario():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        opened_at = datetime(2026, 10, 15, 10, 0)
+        async with session_factory() as db:
+            db.add_all(
+                Session(
+                    chat_id=1, author_id=1, intent="note", status="assembled",
+                    opened_at=opened_at, last_message_at=opened_at, assembled_content=text,
+                )
+                for text in ("первая сессия", "вторая сессия")
+            )
+            await db.commit()
+        async with session_factory() as db:
+            processed = await ow.process_assembled_sessions(db)
+        async with session_factory() as db:
+            statuses = (await db.execute(select(Session.status))).scalars().all()
+        await engine.dispose()
+        return processed, statuses
+
+    processed, statuses = asyncio.run(scenario())
+
+    assert processed == 2
+    assert statuses == ["processed", "processed"]
+    notes = [p for p in vault.files if p.startswith("notes/") and p != "notes/old.md"]
+    assert len(notes) == 1
+    # Обе сессии дописаны в одну заметку — ни одна запись не потеряна
+    note = vault.files[notes[0]]
+    assert "первая сессия" in note and "вторая сессия" in note
+    assert fm.loads(vault.files["notes/old.md"])["related"] == [ow._to_wikilink(notes[0])]
@@ -0,0 +1,56 @@
+import asyncio
+
+import frontmatter as fm
+import pytest
+
+from src.familylog.processor import obsidian_writer as ow
+
+DIARY = "diary/15-окт-26_дневник.md"
+
+
+def _update(vault, content: str, author: str = "Маша") -> fm.Post:
+    vault.files[DIARY] = content
+    asyncio.run(ow.update_diary_authors(DIARY, author))
+    return fm.loads(vault.files[DIARY])
+
+
+def test_author_added_and_body_kept(vault):
+    post = _update(vault, "---\nauthors:\n- Степан\ntags:\n- дневник\n---\n\nутро\n")
+
+    assert post["authors"] == ["Степан", "Маша"]
+    assert post["tags"] == ["дневник"]
+    assert post["updated"]
+    assert post.content == "утро"
+
+
+def test_existing_author_not_duplicated(vault):
+    post = _update(vault, "---\nauthors:\n- Маша\n---\n\nутро\n")
+
+    assert post["authors"] == ["Маша"]
+
+
+def test_scalar_authors_become_list(vault):
+    post = _update(vault, "---\nauthors: Степан\n---\n\nутро\n")
+
+    assert post["authors"] == ["Степан", "Маша"]
+
+
+@pytest.mark.parametrize("block", ["просто текст", "- первый\n- второй"])
+def test_non_mapping_frontmatter_is_rebuilt(vault, block):
+    post = _update(vault, f"---\n{block}\n---\n\nутро\n")
+
+    assert post["authors"] == ["Маша"]
+    assert post.content == "утро"
+
+
+def test_diary_without_frontmatter_gets_one(vault):
+    post = _update(vault, "утро\n")
+
+    assert post["authors"] == ["Маша"]
+    assert post.content == "утро"
+
+
+def test_missing_diary_is_left_alone(vault):
+    asyncio.run(ow.update_diary_authors(DIARY, "Маша"))
+
+    assert DIARY not in vault.files
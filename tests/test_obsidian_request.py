@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.familylog.processor import obsidian_writer as ow
+
+
+def test_get_retried_on_retry_status(vault):
+    vault.files["notes/a.md"] = "a"
+    vault.fail[("GET", "/vault/notes/a.md")] = [503, 502]
+
+    r = asyncio.run(ow.obsidian_request("GET", "/vault/notes/a.md"))
+
+    assert r.status_code == 200
+    assert vault.count("GET", "/vault/notes/a.md") == 3
+
+
+def test_get_returns_last_response_when_attempts_exhausted(vault):
+    vault.fail[("GET", "/vault/notes/a.md")] = [503] * ow.RETRY_ATTEMPTS
+
+    r = asyncio.run(ow.obsidian_request("GET", "/vault/notes/a.md"))
+
+    assert r.status_code == 503
+    assert vault.count("GET", "/vault/notes/a.md") == ow.RETRY_ATTEMPTS
+
+
+def test_post_not_retried_on_5xx(vault):
+    vault.fail[("POST", "/vault/notes/a.md")] = [503]
+
+    r = asyncio.run(ow.obsidian_request("POST", "/vault/notes/a.md", content=b"x"))
+
+    assert r.status_code == 503
+    assert vault.count("POST", "/vault/notes/a.md") == 1
+    assert "notes/a.md" not in vault.files
+
+
+def test_post_retried_on_429(vault):
+    vault.fail[("POST", "/vault/notes/a.md")] = [429]
+
+    r = asyncio.run(ow.obsidian_request("POST", "/vault/notes/a.md", content=b"x"))
+
+    assert r.status_code == 204
+    assert vault.files["notes/a.md"] == "x"
+
+
+def test_post_not_retried_after_request_may_have_arrived(vault):
+    vault.fail[("POST", "/vault/notes/a.md")] = [httpx.ReadError("connection dropped")]
+
+    with pytest.raises(httpx.ReadError):
+        asyncio.run(ow.obsidian_request("POST", "/vault/notes/a.md", content=b"x"))
+    assert vault.count("POST", "/vault/notes/a.md") == 1
+
+
+def test_post_retried_when_connection_failed(vault):
+    vault.fail[("POST", "/vault/notes/a.md")] = [httpx.ConnectError("refused")]
+
+    asyncio.run(ow.obsidian_request("POST", "/vault/notes/a.md", content=b"x"))
+
+    assert vault.files["notes/a.md"] == "x"
+    assert vault.count("POST", "/vault/notes/a.md") == 2
+
+
+def test_put_retried_on_read_error_with_fresh_body(vault):
+    vault.fail[("PUT", "/vault/notes/a.md")] = [httpx.ReadError("connection dropped")]
+    bodies = iter([b"first", b"second"])
+
+    asyncio.run(ow.obsidian_request("PUT", "/vault/notes/a.md", content=lambda: next(bodies)))
+
+    assert vault.files["notes/a.md"] == "second"
+
+
+def test_search_post_retried_on_retry_status(vault):
+    vault.fail[("POST", "/search/")] = [503, 502]
+
+    # После повторов FakeVault отвечает 404 — плагин без поиска
+    assert asyncio.run(ow.obsidian_search_tags({"семья"})) is None
+    assert vault.count("POST", "/search/") == 3
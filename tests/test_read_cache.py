@@ -0,0 +1,45 @@
+import asyncio
+
+from src.familylog.processor import obsidian_writer as ow
+
+
+def test_get_cached_until_write(vault):
+    vault.files["notes/a.md"] = "old"
+
+    async def scenario():
+        assert await ow.obsidian_get("notes/a.md") == "old"
+        assert await ow.obsidian_get("notes/a.md") == "old"
+        assert vault.count("GET", "/vault/notes/a.md") == 1
+
+        # PUT кладёт записанное содержимое в кеш — без повторного GET
+        await ow.obsidian_create("notes/a.md", "new")
+        assert await ow.obsidian_get("notes/a.md") == "new"
+        assert vault.count("GET", "/vault/notes/a.md") == 1
+
+        # POST сбрасывает кеш — следующий GET идёт в vault
+        await ow.obsidian_append("notes/a.md", "+tail")
+        assert await ow.obsidian_get("notes/a.md") == "new+tail"
+        assert vault.count("GET", "/vault/notes/a.md") == 2
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_misses_share_one_request(vault):
+    vault.files["notes/a.md"] = "a"
+
+    async def scenario():
+        return await asyncio.gather(*(ow.obsidian_get("notes/a.md") for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["a"] * 5
+    assert vault.count("GET", "/vault/notes/a.md") == 1
+
+
+def test_listing_invalidated_by_new_file(vault):
+    vault.files["notes/a.md"] = "a"
+
+    async def scenario():
+        assert await ow.obsidian_list_files("notes") == ["notes/a.md"]
+        await ow.obsidian_create("notes/b.md", "b")
+        return await ow.obsidian_list_files("notes")
+
+    assert sorted(asyncio.run(scenario())) == ["notes/a.md", "notes/b.md"]
@@ -0,0 +1,184 @@
+import asyncio
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+pytest.importorskip("onnx_asr")
+
+from src.familylog.processor import stt  # noqa: E402
+from src.familylog.storage.models import Base, Message  # noqa: E402
+
+# Битая запись: модель падает на любой пачке, где она есть
+BROKEN_LENGTH = 3
+
+
+class FakeModel:
+    def __init__(self) -> None:
+        self.batches: list[int] = []
+
+    def recognize(self, waveforms, sample_rate):
+        self.batches.append(len(waveforms))
+        if any(len(w) == BROKEN_LENGTH for w in waveforms):
+            raise RuntimeError("bad waveform")
+        return [f"текст {len(w)}" for w in waveforms]
+
+
+@pytest.fixture
+def model(monkeypatch, tmp_path):
+    fake = FakeModel()
+
+    async def download_file(file_id, dest_dir, extension):
+        return tmp_path / f"{file_id}.{extension}"
+
+    async def decode_pcm(ogg_path: Path):
+        return np.zeros(int(ogg_path.stem), dtype=np.float32)
+
+    async def warmup():
+        pass
+
+    monkeypatch.setattr(stt, "get_model", lambda: fake)
+    monkeypatch.setattr(stt, "warmup", warmup)
+    monkeypatch.setattr(stt, "download_file", download_file)
+    monkeypatch.setattr(stt, "decode_pcm", decode_pcm)
+    monkeypatch.setattr(stt.settings, "STT_BATCH_SIZE", 8)
+    return fake
+
+
+def _run_voice(lengths: list[int]) -> tuple[int, dict[str, tuple[str, str | None]]]:
+    """Прогоняет process_voice_messages по голосовым с raw_content = длина записи."""
+
+    async def scenario():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as db:
+            db.add_all(
+                Message(
+                    telegram_message_id=i, chat_id=1, author_id=1, author_name="Степан",
+                    message_type="voice", raw_content=str(length), created_at=datetime(2026, 10, 15),
+                )
+                for i, length in enumerate(lengths)
+            )
+            await db.commit()
+        async with session_factory() as db:
+            processed = await stt.process_voice_messages(db)
+        async with session_factory() as db:
+            rows = (await db.execute(select(Message))).scalars().all()
+        await engine.dispose()
+        return processed, {m.raw_content: (m.status, m.text_content) for m in rows}
+
+    return asyncio.run(scenario())
+
+
+def test_ready_recordings_transcribed_in_one_batch(model):
+    processed, rows = _run_voice([100, 200, 300])
+
+    assert processed == 3
+    assert model.batches == [3]
+    assert rows == {
+        "100": ("transcribed", "текст 100"),
+        "200": ("transcribed", "текст 200"),
+        "300": ("transcribed", "текст 300"),
+    }
+
+
+def test_batch_split_by_batch_size(model, monkeypatch):
+    monkeypatch.setattr(stt.settings, "STT_BATCH_SIZE", 2)
+
+    processed, _ = _run_voice([100, 200, 300])
+
+    assert processed == 3
+    assert model.batches == [2, 1]
+
+
+def test_broken_recording_does_not_fail_its_batch(model):
+    processed, rows = _run_voice([100, BROKEN_LENGTH, 300])
+
+    assert processed == 2
+    # Пачка упала — каждая запись повторена поштучно
+    assert model.batches == [3, 1, 1, 1]
+    assert rows[str(BROKEN_LENGTH)] == ("error_stt", None)
+    assert rows["100"] == ("transcribed", "текст 100")
+    assert rows["300"] == ("transcribed", "текст 300")
+
+
+def test_model_load_failure_marks_all_errors(model, monkeypatch):
+    async def warmup():
+        raise RuntimeError("no model")
+
+    monkeypatch.setattr(stt, "warmup", warmup)
+
+    processed, rows = _run_voice([100, 200])
+
+    assert processed == 0
+    assert model.batches == []
+    assert {status for status, _ in rows.values()} == {"error_stt"}
+
+
+def _leftover_tasks() -> set[asyncio.Task]:
+    return {t for t in asyncio.all_tasks() if t is not asyncio.current_task()}
+
+
+def test_worker_stopped_when_pipeline_fails(model, monkeypatch):
+    def cleanup(ogg_path):
+        raise OSError("disk gone")
+
+    monkeypatch.setattr(stt, "cleanup", cleanup)
+
+    async def scenario():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with async_sessionmaker(engine)() as db:
+            db.add(Message(
+                telegram_message_id=1, chat_id=1, author_id=1, author_name="Степан",
+                message_type="voice", raw_content="100", created_at=datetime(2026, 10, 15),
+            ))
+            await db.commit()
+            with pytest.raises(OSError):
+                await stt.process_voice_messages(db)
+        await engine.dispose()
+        return _leftover_tasks()
+
+    assert asyncio.run(scenario()) == set()
+
+
+def test_cancelled_run_leaves_no_waiting_tasks(model, monkeypatch):
+    async def scenario():
+        model_loaded = asyncio.Event()
+
+        async def warmup():
+            await model_loaded.wait()
+
+        monkeypatch.setattr(stt, "warmup", warmup)
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with async_sessionmaker(engine)() as db:
+            db.add_all(
+                Message(
+                    telegram_message_id=i, chat_id=1, author_id=1, author_name="Степан",
+                    message_type="voice", raw_content=str(100 + i), created_at=datetime(2026, 10, 15),
+                )
+                for i in range(3)
+            )
+            await db.commit()
+            run = asyncio.create_task(stt.process_voice_messages(db))
+            # Записи ждут в воркере, пока грузится модель, — отменяем прогон
+            await asyncio.sleep(0.05)
+            run.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await run
+            leftover = _leftover_tasks()
+            model_loaded.set()
+        await engine.dispose()
+        return leftover
+
+    leftover = asyncio.run(scenario())
+    # Остаться может только загрузка модели — ни воркера, ни ждущих его записей
+    assert [t.get_coro().__qualname__ for t in leftover] == ["warmup"] * len(leftover)
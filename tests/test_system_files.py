@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from src.familylog.processor import obsidian_writer as ow
+
+
+def test_system_buffer_appends_new_people_to_friends_heading(system_vault, tmp_path):
+    vault = system_vault
+    vault.patch_heading = True
+    buffer = ow.SystemFileBuffer()
+    buffer.add_people(["Петя"])
+    buffer.add_context("сводка", filename="notes/a.md", tags=["семья"])
+
+    async def scenario():
+        await ow.load_base_context(buffer)
+        await buffer.flush(tmp_path / "pending.json")
+
+    asyncio.run(scenario())
+
+    family_path = f"/vault/{ow.FAMILY_MEMORY_FILE}"
+    assert vault.count("PATCH", family_path) == 1
+    assert vault.count("PUT", family_path) == 0
+    assert vault.count("POST", f"/vault/{ow.CURRENT_CONTEXT_FILE}") == 1
+    assert "- [notes/a.md] (семья) сводка" in vault.files[ow.CURRENT_CONTEXT_FILE]
+    # Контекст прогона + свежее чтение перед записью
+    assert vault.count("GET", family_path) == 2
+    assert buffer.is_empty()
+    assert not (tmp_path / "pending.json").exists()
+
+
+def test_system_buffer_rewrites_file_when_heading_patch_rejected(system_vault, tmp_path):
+    vault = system_vault
+    buffer = ow.SystemFileBuffer()
+    buffer.add_people(["Петя"])
+
+    async def scenario():
+        await ow.load_base_context(buffer)
+        await buffer.flush(tmp_path / "pending.json")
+
+    asyncio.run(scenario())
+
+    content = vault.files[ow.FAMILY_MEMORY_FILE]
+    assert vault.count("PUT", f"/vault/{ow.FAMILY_MEMORY_FILE}") == 1
+    # Новый человек — в конце секции друзей, до следующего раздела
+    assert content.index("### Петя") > content.index("### Вася")
+    assert content.index("### Петя") < content.index("## Прочее")
+
+
+def test_system_buffer_keeps_edits_made_during_run(system_vault, tmp_path):
+    vault = system_vault
+    buffer = ow.SystemFileBuffer()
+    buffer.add_people(["Петя"])
+    buffer.add_interests("Степан", ["шахматы"])
+
+    async def scenario():
+        await ow.load_base_context(buffer)
+        # Пока идёт прогон, файл правят в Obsidian
+        vault.files[ow.FAMILY_MEMORY_FILE] += "- правка из Obsidian\n"
+        await buffer.flush(tmp_path / "pending.json")
+
+    asyncio.run(scenario())
+
+    content = vault.files[ow.FAMILY_MEMORY_FILE]
+    assert "- правка из Obsidian" in content
+    assert "- Интересы: шахматы" in content
+    assert "### Петя" in content
+
+
+def test_interests_replace_only_author_section(system_vault, tmp_path):
+    vault = system_vault
+    vault.patch_heading = True
+    buffer = ow.SystemFileBuffer()
+    buffer.add_interests("Степан", ["шахматы"])
+
+    async def scenario():
+        await ow.load_base_context(buffer)
+        vault.files[ow.FAMILY_MEMORY_FILE] += "- правка из Obsidian\n"
+        await buffer.flush(tmp_path / "pending.json")
+
+    asyncio.run(scenario())
+
+    family_path = f"/vault/{ow.FAMILY_MEMORY_FILE}"
+    assert vault.count("PATCH", family_path) == 1
+    assert vault.count("PUT", family_path) == 0
+    assert vault.files[ow.FAMILY_MEMORY_FILE] == (
+        "# Family\n\n## Семья\n### Степан\n- Интересы: шахматы\n- id: 1\n\n"
+        "## Друзья и знакомые\n\n### Вася\n- друг\n\n## Прочее\n- заметка\n- правка из Obsidian\n"
+    )
+
+
+def test_system_buffer_keeps_unwritten_changes_on_disk(system_vault, tmp_path):
+    vault = system_vault
+    pending = tmp_path / "pending.json"
+    vault.fail[("POST", f"/vault/{ow.CURRENT_CONTEXT_FILE}")] = [500]
+    buffer = ow.SystemFileBuffer()
+    buffer.add_context("сводка")
+    buffer.add_tags(["новый"])
+
+    async def scenario():
+        await ow.load_base_context(buffer)
+        await buffer.flush(pending)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(scenario())
+
+    state = json.loads(pending.read_text(encoding="utf-8"))
+    assert state["context_entries"] == ["сводка"]
+    assert state["new_tags"] == []
+    restored = ow.SystemFileBuffer.restore(pending)
+    assert restored.context_entries == ["сводка"]
+
+
+@pytest.mark.parametrize(
+    "content", ["# Tags\n- #семья\n", "# Tags\n- #семья", "# Tags\n- #семья  \n", "# Tags\n- #семья\n\n\n\n"]
+)
+def test_tags_glossary_matches_full_rewrite(system_vault, tmp_path, content):
+    vault = system_vault
+    vault.files[ow.TAGS_GLOSSARY_FILE] = content
+    buffer = ow.SystemFileBuffer()
+    buffer.add_tags(["новый"])
+
+    asyncio.run(buffer.flush(tmp_path / "pending.json"))
+
+    # Дозапись или перезапись — байты те же, что у прежнего PUT content.rstrip() + addition
+    assert vault.files[ow.TAGS_GLOSSARY_FILE] == "# Tags\n- #семья\n\n## Автодобавленные\n- #новый\n"
+
+
+def test_tail_delta():
+    assert ow.tail_delta("a\n", "\n\nb\n") == "\nb\n"
+    assert ow.tail_delta("a", "\nb\n") == "\nb\n"
+    # Хвост файла не является началом addition — дозаписью не обойтись
+    assert ow.tail_delta("a  \n", "\nb\n") is None
+    assert ow.tail_delta("a\n\n\n", "\n\nb\n") is None
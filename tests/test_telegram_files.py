@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.familylog.storage import telegram_files as tf
+
+
+class DroppedStream(httpx.AsyncByteStream):
+    """Тело ответа, обрывающееся на середине."""
+
+    async def __aiter__(self):
+        yield b"x" * 1024
+        raise httpx.ReadError("connection dropped")
+
+
+def _telegram(body: httpx.AsyncByteStream | bytes):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/getFile"):
+            return httpx.Response(200, json={"result": {"file_path": "voice/file.oga"}})
+        if isinstance(body, bytes):
+            return httpx.Response(200, content=body)
+        return httpx.Response(200, stream=body)
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_download_writes_final_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(tf, "_client", _telegram(b"ogg data"))
+
+    path = asyncio.run(tf.download_file("abc", tmp_path, "ogg"))
+
+    assert path == tmp_path / "abc.ogg"
+    assert path.read_bytes() == b"ogg data"
+    assert [p.name for p in tmp_path.iterdir()] == ["abc.ogg"]
+
+
+def test_dropped_download_leaves_no_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(tf, "_client", _telegram(DroppedStream()))
+
+    with pytest.raises(httpx.ReadError):
+        asyncio.run(tf.download_file("abc", tmp_path, "ogg"))
+
+    # Ни обрезанного итогового файла, ни брошенного .part
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_files_reports_errors_per_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(tf, "_client", _telegram(DroppedStream()))
+
+    results = asyncio.run(tf.download_files([("a", tmp_path, "ogg"), ("b", tmp_path, "ogg")]))
+
+    assert all(isinstance(r, httpx.ReadError) for r in results)
+    assert list(tmp_path.iterdir()) == []
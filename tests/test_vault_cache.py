@@ -0,0 +1,55 @@
+import sqlite3
+
+from src.familylog.storage.vault_cache import VaultCache, file_hash
+
+
+def test_tags_and_related_survive_reopen(tmp_path):
+    path = tmp_path / "vault_cache.db"
+    cache = VaultCache(path)
+    cache.set_tags("notes/a.md", "content", ["семья"], ["notes/b.md"])
+    cache.close()
+
+    reopened = VaultCache(path)
+    assert reopened.get_tags("notes/a.md", "content") == ["семья"]
+    assert reopened.get_related("notes/a.md", "content") == ["notes/b.md"]
+    # Содержимое изменилось — кешу больше не верим
+    assert reopened.get_tags("notes/a.md", "changed") is None
+    assert reopened.get_tags("notes/missing.md", "content") is None
+
+
+def test_changes_written_in_one_go_on_close(tmp_path):
+    path = tmp_path / "vault_cache.db"
+    cache = VaultCache(path)
+    cache.set_tags("notes/a.md", "content", ["семья"])
+    cache.set_attachment_hash("attachments/photos/p.jpeg", "abc")
+    # До close() изменения живут только в памяти
+    assert cache.get_tags("notes/a.md", "content") == ["семья"]
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM files").fetchone() == (0,)
+
+    cache.close()
+
+    reopened = VaultCache(path)
+    assert reopened.get_attachment_hash("attachments/photos/p.jpeg") == "abc"
+    assert reopened.get_tags("notes/a.md", "content") == ["семья"]
+
+
+def test_cache_without_related_column_is_migrated(tmp_path):
+    path = tmp_path / "vault_cache.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE files (path TEXT PRIMARY KEY, hash TEXT NOT NULL, tags TEXT NOT NULL)")
+
+    cache = VaultCache(path)
+    cache.set_tags("notes/a.md", "content", [], ["notes/b.md"])
+    cache.close()
+
+    assert VaultCache(path).get_related("notes/a.md", "content") == ["notes/b.md"]
+
+
+def test_file_hash_depends_on_content_only(tmp_path):
+    a, b = tmp_path / "a.jpeg", tmp_path / "b.jpeg"
+    a.write_bytes(b"same")
+    b.write_bytes(b"same")
+    assert file_hash(a) == file_hash(b)
+    b.write_bytes(b"diff")
+    assert file_hash(a) != file_hash(b)